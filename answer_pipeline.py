@@ -0,0 +1,140 @@
+import logging
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from lightrag import QueryParam
+from inference import retrieve_answers
+from rag_factory import RAGFactory
+
+# Per-branch time limits (seconds). A branch that overruns is reported as failed
+# and the answer is returned with whatever the other branch produced.
+RAG_TIMEOUT = 120
+QA_TIMEOUT = 90
+
+# The QA chain is a network-bound LLM pipeline, so a thread is enough to overlap it with
+# the LightRAG query (which runs on RAGFactory's loop). Shared across sessions; sized for
+# a handful of concurrent questions.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="answer-branch")
+
+_DONE = object()
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def format_sources(source):
+    if isinstance(source, list):
+        return "\n".join(f"{i+1}. {src}" for i, src in enumerate(source))
+    elif isinstance(source, str):
+        return "\n".join(f"{i+1}. {src}" for i, src in enumerate(source.split(",")))
+    return "No sources found."
+
+
+def _wait_branch(name, future, timeout, start, results, errors, timings):
+    # Both futures are already running, so each branch gets its full budget
+    # measured from the common start rather than from when we begin waiting on it.
+    remaining = max(0.0, timeout - (time.perf_counter() - start))
+    done, _ = wait([future], timeout=remaining)
+    if not done:
+        future.cancel()
+        errors[name] = f"timed out after {timeout}s"
+        timings[name] = timeout
+        return
+    try:
+        results[name], timings[name] = future.result()
+    except Exception as e:
+        errors[name] = str(e)
+        timings[name] = time.perf_counter() - start
+
+
+def _log_pipeline(timings, errors):
+    logging.info("Answer pipeline timings: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+    for name, error in errors.items():
+        logging.error(f"Answer pipeline branch '{name}' failed: {error}")
+
+
+class AnswerStream:
+    """Run the LightRAG hybrid query and the FAISS QA chain concurrently, streaming the former.
+
+    The LightRAG answer is generated with QueryParam(stream=True) on RAGFactory's loop
+    and handed over token by token through tokens(); it is cancelled if it overruns
+    rag_timeout. The QA chain runs alongside it on a worker thread. result() returns a
+    dict with "response" and "sources" (either may be None if its branch failed or timed
+    out), "errors" keyed by branch, "timings" holding the wall-clock seconds spent in
+    each branch (plus "first_token"), and "context_tokens" with the QA chain's context
+    packing stats.
+    """
+
+    def __init__(self, rag, full_prompt: str, expanded_query: str,
+                 rag_timeout: float = RAG_TIMEOUT, qa_timeout: float = QA_TIMEOUT):
+        self.rag_timeout, self.qa_timeout = rag_timeout, qa_timeout
+        self.errors, self.timings = {}, {}
+        self._parts = []
+        self._finished = False
+        self._queue = queue.Queue()
+        self._start = time.perf_counter()
+        self._rag_future = RAGFactory.submit(self._stream_rag(rag, full_prompt))
+        self._rag_future.add_done_callback(self._rag_done)
+        self._qa_future = _executor.submit(_timed, retrieve_answers, expanded_query)
+
+    async def _stream_rag(self, rag, full_prompt: str):
+        response = await rag.aquery(full_prompt, QueryParam(mode="hybrid", stream=True))
+        if isinstance(response, str):
+            # Cached answers and LightRAG's fail response come back whole
+            self._queue.put(response)
+            return
+        try:
+            async for chunk in response:
+                self._queue.put(chunk)
+        finally:
+            if hasattr(response, "aclose"):
+                await response.aclose()  # also on cancellation: closes the LLM stream
+
+    def _rag_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self._queue.put(future.exception())
+        self._queue.put(_DONE)
+
+    def tokens(self):
+        """Yield answer tokens as they arrive, stopping early on error or timeout."""
+        while not self._finished:
+            remaining = self.rag_timeout - (time.perf_counter() - self._start)
+            try:
+                item = self._queue.get(timeout=max(0.0, remaining))
+            except queue.Empty:
+                self.errors["rag"] = f"timed out after {self.rag_timeout}s"
+                self._rag_future.cancel()  # stop generating on the LightRAG loop
+                item = _DONE
+            if isinstance(item, Exception):
+                self.errors["rag"] = str(item)
+                continue  # _DONE follows
+            if item is _DONE:
+                self._finished = True
+                self.timings["rag"] = time.perf_counter() - self._start
+                return
+            if "first_token" not in self.timings:
+                self.timings["first_token"] = time.perf_counter() - self._start
+            self._parts.append(item)
+            yield item
+
+    def result(self) -> dict:
+        """Wait for the QA chain (and any unread tokens) and return the combined result."""
+        for _ in self.tokens():
+            pass
+        results = {}
+        _wait_branch("qa", self._qa_future, self.qa_timeout, self._start, results, self.errors, self.timings)
+        self.timings["total"] = time.perf_counter() - self._start
+        _log_pipeline(self.timings, self.errors)
+
+        answer = results.get("qa")
+        return {
+            "response": "".join(self._parts) or None,
+            "sources": format_sources(answer["sources"]) if answer else None,
+            "errors": self.errors,
+            "timings": self.timings,
+            "context_tokens": answer.get("context_tokens") if answer else None,
+        }
@@ -1,45 +1,31 @@
 import logging
 from pathlib import Path
-import sqlite3
-import time
-import numpy as np
 
 import streamlit as st
-from lightrag import LightRAG, QueryParam
-from lightrag.llm.openai import openai_embed, gpt_4o_complete
 from langchain_openai import OpenAI
-from lightrag.utils import EmbeddingFunc
-from db_helper import check_if_file_exists, check_working_directory, delete_file, initialize_database
-from do_spaces import download_all_files, upload_file
-from inference import process_files_and_links, load_or_create_faiss_index, retrieve_answers, clear_faiss_index
+from db_helper import bump_corpus_version, check_if_file_exists, check_working_directory, get_corpus_version, initialize_database, list_file_names
+from rag_factory import RAGFactory
+from lightrag_updates import reset as reset_lightrag_map
+from inference import clear_faiss_index, faiss_store
+from answer_pipeline import AnswerStream
+from notifications import notify, render_notifications
+from ingestion_jobs import ACTIVE_STATUSES, JOB_POLL_SECONDS, enqueue_delete, enqueue_file, enqueue_links, list_jobs, start_worker
+from query_cache import get_or_create_expansion, get_cached_answer, store_answer
 from googleapiclient.discovery import build
 from streamlit_js import st_js, st_js_blocking
 from google_auth_oauthlib.flow import Flow
-import logging
-from langchain_openai import OpenAIEmbeddings
-from document_processor import handle_file_upload
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import OpenAIEmbeddings
 
 
-# Initialize FAISS in-memory
-embeddings = OpenAIEmbeddings()
+# FAISS shares the cached embeddings instance and segment store from inference
 FAISS_INDEX_PATH = Path("faiss_index")
 
 def load_faiss_index():
-    if FAISS_INDEX_PATH.exists():
-        return FAISS.load_local(
-            str(FAISS_INDEX_PATH), 
-            embeddings, 
-            allow_dangerous_deserialization=True  # Enable safe loading
-        )
+    # Process-wide handle: cheap on reruns, re-reads segments only when the manifest changes
+    if faiss_store.exists():
+        return faiss_store
     return None
 
 
-def save_faiss_index(vector_store):
-    vector_store.save_local(str(FAISS_INDEX_PATH))
-
-
 
 def initialize_session_state():
     if "chat_history" not in st.session_state:
@@ -53,37 +39,6 @@ def initialize_session_state():
         st.session_state["files_processed"] = False
 
 
-def embedding_func(texts: list[str]) -> np.ndarray:
-    embeddings = openai_embed(
-        texts,
-        model="text-embedding-3-large",
-        api_key=st.secrets["OPENAI_API_KEY"],
-        base_url=None
-    )
-    if embeddings is None:
-        logging.error("Received empty embeddings from API.")
-        return np.array([])
-    return embeddings
-
-
-class RAGFactory:
-    _shared_embedding = EmbeddingFunc(
-        embedding_dim=3072,
-        max_token_size=8192,
-        func=embedding_func
-    )
-
-    @classmethod
-    def create_rag(cls, working_dir: str) -> LightRAG:
-        """Create a LightRAG instance with shared configuration"""
-        return LightRAG(
-            working_dir=working_dir,
-            addon_params={"insert_batch_size": 50},
-            llm_model_func=gpt_4o_complete,
-            embedding_func=cls._shared_embedding
-        )
-
-
 # def generate_explicit_query(query):
 #     """Expands the user query into a detailed and structured response format, incorporating key legal and procedural considerations."""
 #     llm = OpenAI(temperature=0.7)
@@ -168,6 +123,11 @@ class RAGFactory:
 
 
 def generate_explicit_query(query):
+    """Returns the expanded query, reusing the cached expansion of the same (normalized) question."""
+    return get_or_create_expansion(query, expand_query_with_llm)
+
+
+def expand_query_with_llm(query):
     """Expands the user query into a detailed and structured response format, incorporating key legal and procedural considerations, with explicit mention of sources and extracted entities."""
     llm = OpenAI(temperature=0)
 
@@ -278,61 +238,124 @@ DO NOT HALLUCIATE!, IF YOU DO NOT KNOW THE ANSWER KINDLY SAY I DO NOT KNOW CONTA
 
 
 def generate_answer():
-    """Generates an answer when the user enters a query and presses Enter."""
+    """Queues the question when the user presses Enter; main() streams the answer."""
     query = st.session_state.query_input  # Get user query from session state
     if not query:
         return  # Do nothing if query is empty
 
-    with st.spinner("Generating answer..."):
-        expanded_queries = generate_explicit_query(query)
-        full_prompt = f"{custom_prompt}\n\nUser Query: {expanded_queries}"
-        try:
-            working_dir = Path("./analysis_workspace")
-            download_all_files(working_dir)
-            rag = RAGFactory.create_rag(str(working_dir))
-                
-            response = rag.query(full_prompt, QueryParam(mode="hybrid"))
-            answer = retrieve_answers(expanded_queries)
-            if answer:
-                # response = answer["answer"]
-                source = answer["sources"]
-                
-                if isinstance(source, list):
-                    formatted_sources = "\n".join(f"{i+1}. {src}" for i, src in enumerate(source))
-                elif isinstance(source, str):
-                    formatted_sources = "\n".join(f"{i+1}. {src}" for i, src in enumerate(source.split(",")))
-                else:
-                    formatted_sources = "No sources found."
+    # Callbacks run before the script body, so the answer is rendered from main() where
+    # it can be streamed into place below the chat history.
+    st.session_state["pending_query"] = query
 
-            # Store in chat history
-            st.session_state.chat_history.append(("You", query))
-            st.session_state.chat_history.append(("Bot", response))
-            st.session_state.chat_history.append(("Source", formatted_sources))
+    # Reset query input to allow further queries
+    st.session_state.query_input = ""
+
+
+def answer_pending_query():
+    """Answers the queued question, streaming LightRAG tokens as they are generated."""
+    query = st.session_state.pop("pending_query")
+    with st.chat_message("user"):
+        st.write(query)
+
+    corpus_version = get_corpus_version()
+    cached = get_cached_answer(query, corpus_version)
+    if cached:
+        response, formatted_sources = cached
+        with st.chat_message("assistant"):
+            st.write(response)
+    else:
+        try:
+            with st.chat_message("assistant"):
+                with st.spinner("Generating answer..."):
+                    expanded_queries = generate_explicit_query(query)
+                    full_prompt = f"{custom_prompt}\n\nUser Query: {expanded_queries}"
+                    rag = RAGFactory.get_rag("./analysis_workspace")
+                    stream = AnswerStream(rag, full_prompt, expanded_queries)
+                st.write_stream(stream.tokens())
+
+                with st.spinner("Collecting sources..."):
+                    result = stream.result()
+                st.session_state["last_timings"] = result["timings"]
+                st.session_state["last_context_tokens"] = result["context_tokens"]
+
+                response = result["response"]
+                if response is None:
+                    response = f"⚠️ Could not generate an answer: {result['errors'].get('rag')}"
+                    st.write(response)
+            formatted_sources = result["sources"]
+            if formatted_sources is None:
+                formatted_sources = f"⚠️ Sources unavailable: {result['errors'].get('qa')}"
+            if not result["errors"]:
+                store_answer(query, corpus_version, response, formatted_sources)
         except Exception as e:
             st.error(f"Error retrieving response: {e}")
+            return
 
-    # Reset query input to allow further queries
-    st.session_state.query_input = ""
+    with st.chat_message("assistant"):
+        st.write(formatted_sources)
+
+    # Store in chat history
+    st.session_state.chat_history.append(("You", query))
+    st.session_state.chat_history.append(("Bot", response))
+    st.session_state.chat_history.append(("Source", formatted_sources))
     
     
+def ingestion_jobs_panel():
+    """Progress of recent ingestion jobs; reruns the whole app once a job finishes."""
+    jobs = list_jobs()
+    if not jobs:
+        return
+    st.write("### Processing Queue")
+    for job in jobs:
+        name = job["file_name"] or "Web links"
+        if job["status"] in ACTIVE_STATUSES:
+            st.progress(job["progress"], text=f"🔄 {name}: {job['message']}")
+        elif job["status"] == "failed":
+            st.write(f"❌ {name}: {job['message']}")
+        else:
+            st.write(f"✅ {name}: {job['message']}")
+
+    finished = {job["id"] for job in jobs if job["status"] not in ACTIVE_STATUSES}
+    seen = st.session_state.setdefault("finished_jobs", finished)
+    if finished - seen:
+        for job in jobs:
+            if job["id"] in finished - seen:
+                name = job["file_name"] or "Web links"
+                if job["status"] == "failed":
+                    notify(f"{name} failed: {job['message']}", "error")
+                else:
+                    notify(f"{name}: {job['message']}", "success")
+        # New documents are in: refresh the file list and stop polling if the queue is empty
+        st.session_state["finished_jobs"] = finished
+        st.rerun()
+
+
+def show_ingestion_jobs():
+    """Job panel that polls only while something is queued or running."""
+    polling = any(job["status"] in ACTIVE_STATUSES for job in list_jobs())
+    st.fragment(ingestion_jobs_panel, run_every=JOB_POLL_SECONDS if polling else None)()
+
+
 def process_web_links():
-    """Trigger processing when web links are entered."""
+    """Queue the entered web links for the background worker."""
     web_links = st.session_state["web_links"].strip()
     if web_links:  # Ensure input is not empty
-        placeholder = st.empty()
-        placeholder.write("🔄 Processing web links...")
-        time.sleep(5)
-        placeholder.empty()
-
-        process_files_and_links([], web_links.split("\n"))  # Convert to list
-        handle_file_upload([], web_links)
-        st.session_state["files_processed"] = True
-        placeholder = st.empty()
-        placeholder.write("✅ Web links processed!")
-        time.sleep(5)
-        placeholder.empty()
+        if enqueue_links(web_links.split("\n")):
+            st.session_state["files_processed"] = True
+            notify("Web links queued for processing.")
         
         
+def delete_document(file_name):
+    """Queue a document's removal from SQLite, FAISS and LightRAG (runs before the script, so the job panel polls)."""
+    try:
+        if enqueue_delete(file_name):
+            notify(f"'{file_name}' queued for deletion.")
+        else:
+            notify(f"'{file_name}' is already being processed.", "warning")
+    except Exception as e:
+        notify(f"Failed to delete file '{file_name}': {e}", "error")
+
+
 # client_config = st.sidebar.file_uploader("Upload your client secret JSON file", type=["json"])
 # if client_config:
 #     client_config = json.loads(client_config.read())
@@ -422,6 +445,7 @@ def main():
     st.write("Upload a document and ask questions based on structured knowledge retrieval.")
 
     initialize_session_state()
+    start_worker()  # also resumes jobs interrupted by a restart
     
     DOCUMENTS_DIR = Path('documents')
     DOCUMENTS_DIR.mkdir(parents=True, exist_ok=True)
@@ -448,62 +472,38 @@ def main():
         web_links = st.sidebar.text_area("Enter web links (one per line)", key="web_links", on_change=process_web_links)
         
         if st.sidebar.button("Reset FAISS Index"):
-            if FAISS_INDEX_PATH.exists() and FAISS_INDEX_PATH.is_dir():
-                import shutil
-                shutil.rmtree(FAISS_INDEX_PATH)
+            clear_faiss_index()
+
+        # Revised versions of stored files are re-indexed chunk by chunk instead of rejected
+        update_existing = st.sidebar.checkbox("Update documents that were already uploaded", key="update_existing")
+
+    # Queue uploads for the background worker instead of ingesting them in this session
+    if files:
+        queued_uploads = st.session_state.setdefault("queued_uploads", set())
+        for file in files:
+            file_name = file.name
+            update = st.session_state.get("update_existing", False) and check_if_file_exists(file_name)
+            if (file_name, file.size, update) in queued_uploads:
+                continue  # the uploader keeps returning the same files on every rerun
+            queued_uploads.add((file_name, file.size, update))
+
+            if not update and check_if_file_exists(file_name) and check_working_directory(file_name):
+                notify(f"The file '{file_name}' has already been processed.", "warning")
+                continue
+
+            # Saved before queueing so the job survives a restart
+            file_path = DOCUMENTS_DIR / file_name
+            with open(file_path, "wb") as f:
+                f.write(file.getvalue())
+            if enqueue_file(file_name, file_path, update=update):
+                st.session_state["files_processed"] = True
+                notify(f"'{file_name}' queued for {'update' if update else 'processing'}.")
+            else:
+                notify(f"'{file_name}' is already queued.", "warning")
 
-    # Process files and links if present
-    if (files or web_links) and not st.session_state["files_processed"]:
-        if files:  # Process files if available
-            for file in files:
-                file_name = file.name
-                file_in_db = check_if_file_exists(file_name)
-                dir_exists = check_working_directory(file_name)
-
-                if file_in_db and dir_exists:
-                    placeholder = st.empty()
-                    placeholder.warning(f"⚠️ The file '{file_name}' has already been processed.")
-                    time.sleep(5)
-                    placeholder.empty()
-                else:
-                    placeholder = st.empty()
-                    placeholder.write("🔄 Processing files and links...")
-                    time.sleep(5)
-                    placeholder.empty()
-
-                    process_files_and_links(files, web_links)
-                    document = handle_file_upload(files, web_links, DOCUMENTS_DIR)
-            
-                    if document:
-                        if vector_store is None:
-                            vector_store = load_or_create_faiss_index(document)
-                        else:
-                            vector_store.add_texts(
-                                texts=[doc.page_content for doc in document],
-                                metadatas=[{"source": doc.metadata.get("source", "Unknown")} for doc in document]
-                            )
-                        save_faiss_index(vector_store)
-                        st.sidebar.success("✅ Document uploaded successfully!")
-                    else:
-                        st.error("❌ Failed to process the document.")
-                    st.session_state["files_processed"] = True
-
-                    placeholder.write("✅ Files and links processed!")
-                    time.sleep(5)
-                    placeholder.empty()
-
-        elif web_links:  # Process web links even if no files are uploaded
-            placeholder = st.empty()
-            placeholder.write("🔄 Processing web links...")
-            time.sleep(5)
-            placeholder.empty()
-
-            process_files_and_links([], web_links.split("\n"))  # Convert to list
-            st.session_state["files_processed"] = True
-
-            placeholder.write("✅ Web links processed!")
-            time.sleep(5)
-            placeholder.empty()
+    if admin_authenticated:
+        with st.sidebar:
+            show_ingestion_jobs()
 
 
     # Reset processing state and delete working directory
@@ -524,9 +524,12 @@ def main():
         if working_dir.exists() and working_dir.is_dir():
             import shutil
             shutil.rmtree(working_dir)
-            st.sidebar.success("🔄 Processing reset! The working directory has been deleted.")
+            RAGFactory.invalidate(str(working_dir))
+            reset_lightrag_map()  # the chunk map described the deleted workspace
+            bump_corpus_version()
+            notify("Processing reset! The working directory has been deleted.", "success")
         else:
-            st.sidebar.warning("⚠️ No working directory found to delete.")
+            notify("No working directory found to delete.", "warning")
 
     # Input field with automatic query execution on Enter
     st.text_input("Ask a question about the document:", key="query_input", on_change=generate_answer)
@@ -536,13 +539,13 @@ def main():
         with st.chat_message("user" if role == "You" else "assistant"):
             st.write(message)
 
+    if st.session_state.get("pending_query"):
+        answer_pending_query()
+
     # Sidebar: Uploaded files display
     st.sidebar.write("### Uploaded Files")
     try:
-        conn = sqlite3.connect("files.db", check_same_thread=False)
-        cursor = conn.cursor()
-        cursor.execute("SELECT file_name FROM documents;")  # Uses a single `documents` table
-        uploaded_files_list = [file[0] for file in cursor.fetchall()]
+        uploaded_files_list = list_file_names()  # Uses a single `documents` table
 
         if uploaded_files_list:
             for file_name in uploaded_files_list:
@@ -551,17 +554,15 @@ def main():
                 with col1:
                     st.sidebar.write(file_name)
                 with col2:
-                    if st.sidebar.button("Delete", key=delete_key):
-                        try:
-                            delete_file(file_name)
-                            st.sidebar.success(f"✅ File '{file_name}' deleted successfully!")
-                        except Exception as e:
-                            st.error(f"❌ Failed to delete file '{file_name}': {e}")
+                    st.sidebar.button("Delete", key=delete_key, on_click=delete_document, args=(file_name,))
         else:
             st.sidebar.info("ℹ️ No files uploaded.")
     except Exception as e:
         st.sidebar.error(f"❌ Failed to retrieve files: {e}")
 
+    # Messages queued during this run and by on_change callbacks; never blocks
+    render_notifications()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,98 @@
+# Quality vs memory/latency of truncated text-embedding-3-large vectors for LightRAG.
+#
+#   python benchmarks/embedding_dimensions.py [--workspace analysis_workspace] [--questions q.txt]
+#
+# Reads the full 3072-d chunk vectors from the workspace (vdb_chunks.json, or the cold
+# store once the index has been truncated) and compares top-k search at each truncated
+# dimension, with and without full-precision re-scoring, against full-dimension search.
+# Queries are held-out chunks unless --questions gives a file with one question per line
+# (embedded with OPENAI_API_KEY).
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lightrag_storage import COLD_DTYPE, RESCORE_FACTOR, truncate_embeddings  # noqa: E402
+
+FULL_DIM = 3072
+DIMS = [256, 512, 1024]
+
+
+def load_full_vectors(workspace: Path, namespace: str) -> np.ndarray:
+    with open(workspace / f"vdb_{namespace}.json", encoding="utf-8") as f:
+        storage = json.load(f)
+    if storage["embedding_dim"] == FULL_DIM:
+        return np.frombuffer(base64.b64decode(storage["matrix"]), dtype=np.float32).reshape(-1, FULL_DIM)
+    conn = sqlite3.connect(workspace / f"vdb_{namespace}_full.db")
+    try:
+        rows = conn.execute("SELECT vector FROM vectors").fetchall()
+    finally:
+        conn.close()
+    return np.stack([np.frombuffer(blob, dtype=COLD_DTYPE) for blob, in rows]).astype(np.float32)
+
+
+def top_k(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    scores = matrix @ query
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark truncated embedding dimensions")
+    parser.add_argument("--workspace", default="analysis_workspace")
+    parser.add_argument("--namespace", default="chunks", help="chunks, entities or relationships")
+    parser.add_argument("--questions", help="file with one question per line")
+    parser.add_argument("--queries", type=int, default=200, help="held-out vectors used as queries")
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--rescore-factor", type=int, default=RESCORE_FACTOR)
+    args = parser.parse_args()
+
+    vectors = truncate_embeddings(load_full_vectors(Path(args.workspace), args.namespace), FULL_DIM)
+    if args.questions:
+        from embedding_client import embed_texts
+
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = truncate_embeddings(
+            embed_texts(questions, "text-embedding-3-large", api_key=os.environ["OPENAI_API_KEY"]), FULL_DIM
+        )
+        corpus = vectors
+    else:
+        order = np.random.default_rng(0).permutation(len(vectors))
+        queries, corpus = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    k = min(args.k, len(corpus) - 1)
+    cold = corpus.astype(COLD_DTYPE).astype(np.float32)
+    print(f"{len(corpus)} {args.namespace} vectors, {len(queries)} queries, k={k}\n")
+
+    truth = [set(top_k(corpus, q, k)) for q in queries]
+    print(f"{'dims':>5} {'rescore':>7} {'index MB':>8} {'B/vector':>8} {'recall@k':>8} {'p50 ms':>7}")
+    for dim in DIMS + [FULL_DIM]:
+        index = truncate_embeddings(corpus, dim)
+        for rescore in ([False, True] if dim < FULL_DIM else [False]):
+            recalls, latencies = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                if rescore:
+                    candidates = top_k(index, truncate_embeddings(query[None], dim)[0], k * args.rescore_factor)
+                    found = candidates[np.argsort(-(cold[candidates] @ query))[:k]]
+                else:
+                    found = top_k(index, truncate_embeddings(query[None], dim)[0], k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & set(found)) / k)
+            # vdb_*.json stores float32 base64-encoded (4/3 overhead)
+            bytes_per_vector = dim * 4 * 4 / 3
+            print(f"{dim:>5} {'yes' if rescore else 'no':>7} {bytes_per_vector * len(corpus) / 1e6:>8.1f} "
+                  f"{bytes_per_vector:>8.0f} {np.mean(recalls):>8.3f} {np.percentile(latencies, 50):>7.2f}")
+    print(f"\ncold store (float16, re-scoring only): {FULL_DIM * np.dtype(COLD_DTYPE).itemsize * len(corpus) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Compare FAISS index types for the base segment: recall@k against exact search,
+# per-query latency, build time and index size.
+#
+#   python benchmarks/faiss_index_types.py [--synthetic 100000] [--k 50] [--queries 200]
+#
+# Uses the vectors in faiss_index/ by default; --synthetic generates clustered
+# vectors instead, to see how the types behave at sizes the corpus has not reached yet.
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from faiss_store import INDEX_TYPES, FaissStore, build_index, index_vectors  # noqa: E402
+
+
+def stored_vectors(path: str) -> np.ndarray:
+    store = FaissStore(Path(path), embeddings=None)
+    store.load()
+    parts = [index_vectors(index)[0] for index in (store.base, store.delta_index) if index is not None]
+    return np.vstack(parts).astype(np.float32)
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 200) -> np.ndarray:
+    # Embeddings are clustered by topic, which is what IVF/HNSW exploit; uniform noise would not be
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types")
+    parser.add_argument("--index", default="faiss_index", help="FAISS store directory to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=0, help="use this many synthetic vectors instead")
+    parser.add_argument("--dim", type=int, default=1536, help="dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="held-out vectors used as queries")
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--types", nargs="*", default=list(INDEX_TYPES))
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.synthetic, args.dim) if args.synthetic else stored_vectors(args.index)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    queries = vectors[order[:args.queries]]
+    corpus = np.ascontiguousarray(vectors[order[args.queries:]])
+    ids = np.arange(len(corpus), dtype=np.int64)
+    k = min(args.k, len(corpus))
+    print(f"{len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={k}\n")
+
+    print(f"{'type':<9} {'build s':>8} {'size MB':>8} {'recall@k':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    truth = None
+    for index_type in ["flat"] + [t for t in args.types if t != "flat"]:
+        start = time.perf_counter()
+        index = build_index(index_type, corpus, ids)
+        build_seconds = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(index)) / 1e6
+
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            _, found = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(found[0])
+        if truth is None:
+            truth = results  # flat is exact
+        recall = np.mean([len(set(r) & set(t)) / k for r, t in zip(results, truth)])
+        print(f"{index_type:<9} {build_seconds:>8.2f} {size_mb:>8.1f} {recall:>8.3f} "
+              f"{np.percentile(latencies, 50):>7.2f} {np.percentile(latencies, 95):>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Compare PDF extraction backends over the PDFs in documents/.
+#
+#   python benchmarks/pdf_backends.py [--repeat 3] [pdf ...]
+#
+# Reports wall time, pages/second, table pages handed to pdfplumber, and how close
+# each backend's text is to the pdfplumber baseline (token-level Jaccard).
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pdf_extraction import extract_page_range, count_pages, resolve_backend  # noqa: E402
+
+BACKENDS = ["pdfplumber", "pymupdf", "pypdfium2"]
+
+
+def tokens(pages) -> set:
+    return set(re.findall(r"\w+", " ".join(text for _, text, _, _ in pages).lower()))
+
+
+def run(path: str, backend: str, repeat: int):
+    best, pages = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages = extract_page_range(path, 0, count_pages(path, backend), backend)
+        best = min(best, time.perf_counter() - start)
+    return best, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare PDF extraction backends")
+    parser.add_argument("pdfs", nargs="*", help="PDFs to benchmark (default: documents/*.pdf)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per backend; the fastest is reported")
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or sorted(str(p) for p in Path("documents").glob("*.pdf"))
+    backends = [b for b in BACKENDS if resolve_backend(b) == b]
+
+    print(f"{'document':<32} {'backend':<11} {'pages':>5} {'seconds':>8} {'pages/s':>8} {'speedup':>7} "
+          f"{'tbl pages':>9} {'tables':>6} {'text sim':>8}")
+    totals = {b: 0.0 for b in backends}
+    for path in pdfs:
+        baseline_time, baseline_pages = run(path, "pdfplumber", args.repeat)
+        baseline_tokens = tokens(baseline_pages)
+        for backend in backends:
+            if backend == "pdfplumber":
+                elapsed, pages = baseline_time, baseline_pages
+            else:
+                elapsed, pages = run(path, backend, args.repeat)
+            totals[backend] += elapsed
+            backend_tokens = tokens(pages)
+            union = baseline_tokens | backend_tokens
+            similarity = len(baseline_tokens & backend_tokens) / len(union) if union else 1.0
+            table_pages = sum(1 for _, _, tables, _ in pages if tables)
+            n_tables = sum(len(tables) for _, _, tables, _ in pages)
+            print(f"{Path(path).name[:32]:<32} {backend:<11} {len(pages):>5} {elapsed:>8.3f} "
+                  f"{len(pages) / elapsed:>8.1f} {baseline_time / elapsed:>6.1f}x "
+                  f"{table_pages:>9} {n_tables:>6} {similarity:>8.3f}")
+
+    print()
+    for backend, total in totals.items():
+        print(f"total {backend:<11} {total:8.3f}s  ({totals['pdfplumber'] / total:.1f}x vs pdfplumber)")
+
+
+if __name__ == "__main__":
+    main()
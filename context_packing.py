@@ -0,0 +1,170 @@
+import logging
+import re
+import threading
+from typing import Any, Optional
+import tiktoken
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+CONTEXT_TOKEN_BUDGET = 2500     # most prompt tokens given to retrieved context
+CONTEXT_MODEL = "gpt-3.5-turbo-instruct"  # langchain_openai.OpenAI default; picks the tokenizer
+DOCUMENT_PROMPT_TOKENS = 30     # "Content: ...\nSource: ..." wrapper the chain puts around each block
+NEAR_DUPLICATE_JACCARD = 0.9    # word-shingle similarity above which a chunk is dropped
+MIN_OVERLAP_CHARS = 20          # shortest suffix/prefix match treated as chunk overlap
+MAX_OVERLAP_CHARS = 400         # longer than the 200-character splitter overlap
+MIN_TRUNCATED_TOKENS = 100      # don't squeeze in a block cut shorter than this
+
+_stats = threading.local()
+
+
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = CONTEXT_MODEL) -> int:
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def _shingles(text: str, size: int = 5) -> set:
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right (0 if too short)."""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_CHARS), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _try_merge(block: dict, doc: Document) -> bool:
+    """Merge doc into block if they are adjacent or overlapping pieces of the same source."""
+    if block["source"] != doc.metadata.get("source"):
+        return False
+    text = doc.page_content
+    if text in block["text"]:
+        return True
+    start = doc.metadata.get("start_index")
+    if start is not None and block["start"] is not None:
+        end = start + len(text)
+        if start > block["end"] or end < block["start"]:
+            return False
+        prefix = text[:block["start"] - start] if start < block["start"] else ""
+        suffix = text[block["end"] - start:] if end > block["end"] else ""
+        block["text"] = prefix + block["text"] + suffix
+        block["start"], block["end"] = min(start, block["start"]), max(end, block["end"])
+        return True
+    overlap = _overlap(block["text"], text)
+    if overlap:
+        block["text"] += text[overlap:]
+        return True
+    overlap = _overlap(text, block["text"])
+    if overlap:
+        block["text"] = text[:len(text) - overlap] + block["text"]
+        return True
+    return False
+
+
+def _block_document(block: dict) -> Document:
+    metadata = {**block["metadata"], "start_index": block["start"]}
+    if block["start"] is None:
+        del metadata["start_index"]
+    return Document(page_content=block["text"], metadata=metadata)
+
+
+def pack_documents(documents: list[Document], max_tokens: int = CONTEXT_TOKEN_BUDGET,
+                   model: str = CONTEXT_MODEL) -> tuple[list[Document], dict]:
+    """Merge overlapping chunks, drop near-duplicates and fill a token budget in relevance order.
+
+    documents must be ordered most relevant first. Returns the packed documents (one per
+    merged block, with the metadata of its most relevant chunk) and token statistics.
+    """
+    encoding = _encoding(model)
+    tokens_in = sum(len(encoding.encode(doc.page_content, disallowed_special=())) for doc in documents)
+
+    kept, kept_shingles, duplicates = [], [], 0
+    for doc in documents:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / len(shingles | other) >= NEAR_DUPLICATE_JACCARD for other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+
+    blocks = []
+    for doc in kept:
+        if not any(_try_merge(block, doc) for block in blocks):
+            start = doc.metadata.get("start_index")
+            blocks.append({
+                "source": doc.metadata.get("source"), "metadata": doc.metadata, "text": doc.page_content,
+                "start": start, "end": start + len(doc.page_content) if start is not None else None,
+            })
+    # A later chunk can bridge two blocks that were separate before; merge until stable
+    merged = True
+    while merged:
+        merged = False
+        for i, j in ((i, j) for i in range(len(blocks)) for j in range(i + 1, len(blocks))):
+            if _try_merge(blocks[i], _block_document(blocks[j])):
+                del blocks[j]
+                merged = True
+                break
+
+    packed, tokens_out = [], 0
+    for block in blocks:
+        tokens = encoding.encode(block["text"], disallowed_special=())
+        remaining = max_tokens - tokens_out - DOCUMENT_PROMPT_TOKENS * (len(packed) + 1)
+        if len(tokens) > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                continue  # a smaller, less relevant block may still fit
+            tokens = tokens[:remaining]
+            block["text"] = encoding.decode(tokens)
+        packed.append(Document(page_content=block["text"], metadata=block["metadata"]))
+        tokens_out += len(tokens)
+
+    stats = {
+        "chunks_in": len(documents), "duplicates_dropped": duplicates,
+        "blocks_out": len(packed), "tokens_in": tokens_in, "tokens_out": tokens_out,
+        "tokens_saved": tokens_in - tokens_out,
+    }
+    logging.info(
+        f"Packed {len(documents)} chunks into {len(packed)} blocks: {tokens_out}/{tokens_in} tokens "
+        f"({tokens_in - tokens_out} saved, {duplicates} near-duplicates dropped)"
+    )
+    return packed, stats
+
+
+def last_packing_stats() -> dict:
+    """Stats of the last pack_documents call made by a PackedRetriever on this thread."""
+    return getattr(_stats, "value", None)
+
+
+class PackedRetriever(BaseRetriever):
+    """Wraps a retriever and packs its results into the context budget before they reach the chain.
+
+    The budget is max_tokens, lowered per query when context_window (the model's) could
+    not otherwise hold reserved_tokens (prompt template and completion), the question
+    and the packed context together.
+    """
+
+    retriever: Any
+    max_tokens: int = CONTEXT_TOKEN_BUDGET
+    context_window: Optional[int] = None
+    reserved_tokens: int = 0
+    model: str = CONTEXT_MODEL
+
+    def budget(self, query: str) -> int:
+        if self.context_window is None:
+            return self.max_tokens
+        available = self.context_window - self.reserved_tokens - count_tokens(query, self.model)
+        if available < self.max_tokens:
+            logging.info(f"Context budget lowered to {max(0, available)} tokens to fit the model window")
+        return max(0, min(self.max_tokens, available))
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
+        documents = self.retriever.invoke(query)
+        packed, _stats.value = pack_documents(documents, self.budget(query), self.model)
+        return packed
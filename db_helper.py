@@ -1,75 +1,434 @@
+import logging
+import queue
 import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+import xxhash
+import zstandard
 from document_processor import DocumentProcessor
 
 # Initialize document processor
 process_document = DocumentProcessor()
 
+DB_PATH = "files.db"
+POOL_SIZE = 8               # idle connections kept open; more are opened under load and closed on return
+BUSY_TIMEOUT_MS = 10000     # wait this long for another session's write lock instead of failing
+STATEMENT_CACHE_SIZE = 256  # compiled statements kept per connection (sqlite3 reuses them by SQL text)
+ZSTD_LEVEL = 9              # document text is written once and read rarely; favour ratio over speed
+SPOOL_BYTES = 8 << 20       # compressed text a BlobWriter keeps in memory before spilling to a temp file
+
+logger = logging.getLogger(__name__)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+
+
+def _open_connection():
+    conn = sqlite3.connect(
+        DB_PATH, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+        check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    # WAL: readers never block the writer and vice versa; NORMAL sync is durable enough under WAL
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS};")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-16000;")  # 16 MB page cache
+    return conn
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled autocommit connection to files.db; nested calls on a thread share it."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+
+@contextmanager
+def transaction():
+    """Run the block as one write transaction, committed on success and rolled back on error.
+
+    BEGIN IMMEDIATE takes the write lock up front, so a concurrent writer waits for
+    busy_timeout instead of failing with "database is locked" when a read-then-write
+    transaction tries to upgrade. Nested calls join the outer transaction.
+    """
+    with connection() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE;")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
 # Initialize database with a single table
 def initialize_database():
-    conn = sqlite3.connect("files.db")
-    cursor = conn.cursor()
+    with transaction() as conn:
+        _create_tables(conn.cursor())
+        migrated = _migrate_inline_content(conn)
+    if migrated:
+        with connection() as conn:
+            conn.execute("VACUUM;")  # give the space of the moved text back to the filesystem
 
+
+def _create_tables(cursor):
+    # One row per file name or URL; the text lives in blobs, keyed by its content hash.
+    # source is the "source" metadata of the document's chunks in the FAISS docstore.
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS documents (
             id INTEGER PRIMARY KEY,
             file_name TEXT UNIQUE,
-            file_content TEXT,
+            content_hash TEXT,
+            source_hash TEXT,
+            source TEXT,
             upload_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
     """)
-    
-    conn.commit()
-    conn.close()
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(documents);")]
+    for column in ("content_hash", "source_hash", "source"):  # added after the first release
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE documents ADD COLUMN {column} TEXT;")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents (content_hash);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_source_hash ON documents (source_hash);")
+
+    # zstd-compressed document text, content-addressed so identical documents are stored once
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        );
+    """)
+
+    # Cache of LLM query expansions (see query_cache.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS query_expansions (
+            normalized_query TEXT PRIMARY KEY,
+            expansion TEXT NOT NULL,
+            embedding BLOB,  -- no longer written; lookups are exact
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER DEFAULT 0
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_query_expansions_last_used ON query_expansions (last_used);")
+
+    # Final answers keyed by normalized query and the corpus version they were computed against
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            normalized_query TEXT NOT NULL,
+            corpus_version INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            sources TEXT NOT NULL,
+            size_bytes INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (normalized_query, corpus_version)
+        );
+    """)
+
+    # Single-row counter bumped whenever the knowledge base changes
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS corpus_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        );
+    """)
+    cursor.execute("INSERT OR IGNORE INTO corpus_version (id, version) VALUES (1, 0);")
+
+    # Hit/miss counters shared by the query caches
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cache_stats (
+            cache_name TEXT PRIMARY KEY,
+            hits INTEGER DEFAULT 0,
+            misses INTEGER DEFAULT 0
+        );
+    """)
+
+    # Durable ingestion queue worked off by ingestion_jobs.py
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT,
+            file_path TEXT,
+            web_links TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            action TEXT NOT NULL DEFAULT 'ingest'
+        );
+    """)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(ingestion_jobs);")]
+    if "action" not in columns:  # 'ingest', 'update' or 'delete'; added after the queue was introduced
+        cursor.execute("ALTER TABLE ingestion_jobs ADD COLUMN action TEXT NOT NULL DEFAULT 'ingest';")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs (status, id);")
+
+    # Word fingerprint of every chunk in the FAISS index, per source (see dedup.py)
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(chunk_signatures);")]
+    if columns and "fingerprint" not in columns:
+        # SimHashes compared across sources; they cannot be turned into fingerprints
+        cursor.execute("DROP TABLE chunk_signatures;")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chunk_signatures (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint INTEGER NOT NULL,
+            source TEXT
+        );
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chunk_signatures_source ON chunk_signatures (source, fingerprint);"
+    )
+
+    # Chunks each file produced in the LightRAG workspace, and the graph nodes ("" target)
+    # and edges each chunk contributed to (see lightrag_updates.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lightrag_chunks (
+            file_name TEXT NOT NULL,
+            chunk_id TEXT NOT NULL,
+            PRIMARY KEY (file_name, chunk_id)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_lightrag_chunks_chunk_id ON lightrag_chunks (chunk_id);")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS lightrag_refs (
+            chunk_id TEXT NOT NULL,
+            entity TEXT NOT NULL,
+            target TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (chunk_id, entity, target)
+        );
+    """)
+
+
+def content_hash(text):
+    return xxhash.xxh3_128_hexdigest(text.encode("utf-8"))
+
+
+class BlobWriter:
+    """Text appended piece by piece, compressed and hashed as it arrives.
+
+    Same hash and stored format as put_blob(conn, text), so a document can be stored
+    without ever being held whole; pass the writer to put_blob (or insert_documents).
+    """
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self._writer = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._file, closefd=False)
+        self._hash = xxhash.xxh3_128()
+        self._closed = False
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self._hash.update(data)
+        self._writer.write(data)
+        self.size += len(data)
+
+    def close(self):
+        if not self._closed:
+            self._writer.flush(zstandard.FLUSH_FRAME)
+            self._closed = True
+
+    @property
+    def digest(self):
+        return self._hash.hexdigest()
+
+    def compressed(self):
+        self.close()
+        self._file.seek(0)
+        return self._file.read()
+
+    def read(self):
+        return zstandard.ZstdDecompressor().decompressobj().decompress(self.compressed()).decode("utf-8")
+
+
+# Store text (a str or a BlobWriter) once under its hash and return the hash
+def put_blob(conn, text):
+    if isinstance(text, BlobWriter):
+        digest = text.digest
+        if conn.execute("SELECT 1 FROM blobs WHERE hash = ?;", (digest,)).fetchone() is None:
+            conn.execute("INSERT INTO blobs (hash, size, data) VALUES (?, ?, ?);", (digest, text.size, text.compressed()))
+        return digest
+    digest = content_hash(text)
+    if conn.execute("SELECT 1 FROM blobs WHERE hash = ?;", (digest,)).fetchone() is None:
+        data = text.encode("utf-8")
+        compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+        conn.execute("INSERT INTO blobs (hash, size, data) VALUES (?, ?, ?);", (digest, len(data), compressed))
+    return digest
+
+
+def get_blob(conn, digest):
+    row = conn.execute("SELECT data FROM blobs WHERE hash = ?;", (digest,)).fetchone()
+    # decompressobj: frames written by BlobWriter do not record the content size
+    return zstandard.ZstdDecompressor().decompressobj().decompress(row[0]).decode("utf-8") if row else None
+
+
+# Drop blobs no document refers to any more
+def _delete_unreferenced_blobs(conn, digests):
+    conn.executemany("""
+        DELETE FROM blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM documents WHERE content_hash = blobs.hash);
+    """, [(digest,) for digest in digests])
+
+
+# Move text stored inline by older versions into blobs
+def _migrate_inline_content(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(documents);")]
+    if "file_content" not in columns:
+        return 0
+    rows = conn.execute("SELECT id, file_content FROM documents WHERE file_content IS NOT NULL;").fetchall()
+    for row_id, text in rows:
+        conn.execute(
+            "UPDATE documents SET content_hash = ?, file_content = NULL WHERE id = ?;", (put_blob(conn, text), row_id)
+        )
+    if rows:
+        print(f"✅ Moved the text of {len(rows)} documents into compressed blobs.")
+    return len(rows)
 
 
 # Insert document metadata and content into the database
-def insert_file_metadata(file_name, file_content):
-    conn = sqlite3.connect("files.db")
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""
-            INSERT INTO documents (file_name, file_content)
-            VALUES (?, ?);
-        """, (file_name, file_content))
-        print(f"Inserted file content: {file_content[:100]}...")  # Print only the first 100 chars
-        conn.commit()
-    except sqlite3.IntegrityError:
-        print(f"⚠️ File '{file_name}' already exists in the database.")
-    except Exception as e:
-        print(f"❌ Error inserting file metadata: {e}")
-    finally:
-        conn.close()
+def insert_file_metadata(file_name, file_content, source_hash=None, source=None):
+    insert_documents([(file_name, file_content, source_hash, source)])
+
+
+# Insert (file_name, file_content, source_hash, source) rows in one transaction (file_content: str or BlobWriter);
+# names already stored are skipped. Returns the number inserted; errors propagate so ingestion jobs fail and retry.
+def insert_documents(rows):
+    with transaction() as conn:
+        hashed_rows = [
+            (file_name, put_blob(conn, file_content), source_hash, source)
+            for file_name, file_content, source_hash, source in rows
+        ]
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO documents (file_name, content_hash, source_hash, source) VALUES (?, ?, ?, ?);",
+            hashed_rows
+        )
+        inserted = conn.total_changes - before
+        _delete_unreferenced_blobs(conn, {digest for _, digest, _, _ in hashed_rows})
+    logger.info(f"Inserted {inserted} of {len(rows)} documents")
+    if inserted < len(rows):
+        logger.warning(f"{len(rows) - inserted} document(s) already exist in the database.")
+    return inserted
+
+
+# Point an existing document at new text (a revised upload); returns False if it is not stored
+def update_document(file_name, file_content, source_hash=None, source=None):
+    with transaction() as conn:
+        row = conn.execute("SELECT content_hash FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+        if row is None:
+            return False
+        conn.execute("""
+            UPDATE documents SET content_hash = ?, source_hash = ?, source = COALESCE(?, source),
+                upload_time = CURRENT_TIMESTAMP
+            WHERE file_name = ?;
+        """, (put_blob(conn, file_content), source_hash, source, file_name))
+        if row[0]:
+            _delete_unreferenced_blobs(conn, [row[0]])
+        bump_corpus_version()
+    logger.info(f"File '{file_name}' updated in database.")
+    return True
 
 
 # Delete document by file name
 def delete_file(file_name):
-    conn = sqlite3.connect("files.db")
-    cursor = conn.cursor()
     try:
-        cursor.execute("DELETE FROM documents WHERE file_name = ?", (file_name,))
-        conn.commit()
-        print(f"✅ File '{file_name}' deleted from database.")
-    except Exception as e:
-        print(f"❌ Error deleting file: {e}")
-    finally:
-        conn.close()
+        with transaction() as conn:
+            row = conn.execute("SELECT content_hash FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+            conn.execute("DELETE FROM documents WHERE file_name = ?", (file_name,))
+            if row and row[0]:
+                _delete_unreferenced_blobs(conn, [row[0]])
+            bump_corpus_version()
+        logger.info(f"File '{file_name}' deleted from database.")
+    except Exception:
+        logger.exception(f"Error deleting file '{file_name}'")
 
 
 # Check if a file already exists in the database
 def check_if_file_exists(file_name):
-    conn = sqlite3.connect("files.db")
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT 1 FROM documents WHERE file_name = ?", (file_name,))
-    result = cursor.fetchone()
-    
-    conn.close()
-    
+    with connection() as conn:
+        result = conn.execute("SELECT 1 FROM documents WHERE file_name = ?", (file_name,)).fetchone()
     return result is not None  # Returns True if file exists, otherwise False
 
 
+# Stored text of a document, or None
+def get_document_text(file_name):
+    with connection() as conn:
+        row = conn.execute("SELECT content_hash FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+        return get_blob(conn, row[0]) if row and row[0] else None
+
+
+# FAISS chunk source of a document, or None (documents stored before sources were recorded)
+def get_document_source(file_name):
+    with connection() as conn:
+        row = conn.execute("SELECT source FROM documents WHERE file_name = ?", (file_name,)).fetchone()
+    return row[0] if row else None
+
+
+# Name of a stored document with this extracted text or uploaded file hash, or None
+def find_duplicate_document(text=None, source_hash=None):
+    with connection() as conn:
+        if source_hash is not None:
+            row = conn.execute("SELECT file_name FROM documents WHERE source_hash = ?", (source_hash,)).fetchone()
+            if row:
+                return row[0]
+        if text is not None:
+            row = conn.execute(
+                "SELECT file_name FROM documents WHERE content_hash = ?", (content_hash(text),)
+            ).fetchone()
+            if row:
+                return row[0]
+    return None
+
+
+# Names of all stored documents
+def list_file_names():
+    with connection() as conn:
+        return [row[0] for row in conn.execute("SELECT file_name FROM documents;")]
+
+
 # Check if the working directory exists for a processed file
 def check_working_directory(file_name):
     working_dir = Path(f"./analysis_workspace/{file_name.split('.')[0]}")
     return working_dir.exists() and working_dir.is_dir()
+
+
+# Current knowledge-base version; cached answers are only valid for the version they were computed at
+def get_corpus_version():
+    with connection() as conn:
+        row = conn.execute("SELECT version FROM corpus_version WHERE id = 1;").fetchone()
+    return row[0] if row else 0
+
+
+# Record that the knowledge base changed and drop answers computed against older versions
+def bump_corpus_version():
+    with transaction() as conn:
+        conn.execute("INSERT OR IGNORE INTO corpus_version (id, version) VALUES (1, 0);")
+        conn.execute("UPDATE corpus_version SET version = version + 1 WHERE id = 1;")
+        version = conn.execute("SELECT version FROM corpus_version WHERE id = 1;").fetchone()[0]
+        conn.execute("DELETE FROM answer_cache WHERE corpus_version < ?;", (version,))
+    return version
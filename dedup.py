@@ -0,0 +1,101 @@
+# Duplicate detection at ingestion time. Whole documents are matched exactly by hash
+# (uploaded file bytes before parsing, extracted text after; see db_helper). Chunks are
+# matched by a fingerprint of their words, so a passage repeated within one document
+# (a boilerplate notice on every page, a section reprinted in an appendix) is embedded
+# once even when its line breaks or punctuation differ.
+#
+# Chunks are only compared with chunks of the same source. A chunk skipped because
+# another document holds the same words would lose its only vector when that document
+# is deleted, and policy text that differs in a single date, dose or amount must never
+# be treated as a copy, so matches are exact on the normalized words.
+import re
+import threading
+import xxhash
+from db_helper import connection, transaction
+
+MIN_SIGNATURE_WORDS = 20    # shorter chunks (headings, table cells) are always kept
+FILE_HASH_BLOCK = 1 << 20
+
+
+def file_hash(path) -> str:
+    """xxh3-128 of a file's bytes, read in blocks."""
+    digest = xxhash.xxh3_128()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FILE_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(text: str):
+    """64-bit hash of the lowercased words of text (as a signed int for SQLite), or None if too short."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < MIN_SIGNATURE_WORDS:
+        return None
+    return xxhash.xxh3_64_intdigest(" ".join(words).encode()) - (1 << 63)
+
+
+class RepeatedChunkFilter:
+    """Drops chunks whose words repeat a chunk already indexed or kept from the same source.
+
+    keep() runs before embedding; record() once the kept chunks are saved in the index,
+    so a failed upload does not hide its chunks from the next attempt.
+    """
+
+    def __init__(self):
+        self.skipped = 0
+        self._known = {}    # source -> fingerprints indexed or kept from it
+        self._kept = []     # (fingerprint, source) kept by this filter and not recorded yet
+        self._lock = threading.Lock()
+
+    def _fingerprints(self, source: str) -> set:
+        if source not in self._known:
+            with connection() as conn:
+                rows = conn.execute("SELECT fingerprint FROM chunk_signatures WHERE source = ?;", (source,))
+                self._known[source] = {row[0] for row in rows}
+        return self._known[source]
+
+    def keep(self, texts: list[str], sources: list[str]) -> list[int]:
+        """Indices of the texts that are not repeats."""
+        kept = []
+        with self._lock:
+            for i, (text, source) in enumerate(zip(texts, sources)):
+                signature = fingerprint(text)
+                if signature is not None:
+                    known = self._fingerprints(source)
+                    if signature in known:
+                        self.skipped += 1
+                        continue
+                    known.add(signature)
+                    self._kept.append((signature, source))
+                kept.append(i)
+        return kept
+
+    def record(self):
+        """Store the fingerprints of the kept chunks so later uploads of the source are compared against them."""
+        with self._lock:
+            rows, self._kept = self._kept, []
+        with transaction() as conn:
+            conn.executemany("INSERT INTO chunk_signatures (fingerprint, source) VALUES (?, ?);", rows)
+
+
+def forget(source: str, texts: list[str]):
+    """Drop the stored fingerprints of chunks removed from source, so their replacements are not skipped."""
+    rows = [(source, signature) for signature in map(fingerprint, texts) if signature is not None]
+    with transaction() as conn:
+        conn.executemany("""
+            DELETE FROM chunk_signatures WHERE id = (
+                SELECT id FROM chunk_signatures WHERE source = ? AND fingerprint = ? LIMIT 1
+            );
+        """, rows)
+
+
+def forget_source(source: str):
+    """Drop every stored fingerprint of a deleted source."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM chunk_signatures WHERE source = ?;", (source,))
+
+
+def reset():
+    """Forget every stored fingerprint; called when the FAISS index is cleared."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM chunk_signatures;")
@@ -1,15 +1,12 @@
 
-from PyPDF2 import PdfReader
+from dataclasses import dataclass, field
 import streamlit as st
 from langchain.docstore.document import Document
 import trafilatura
 from utils import clean_text
 import logging
 import openai
-import pdfplumber
-import time
-import requests
-from bs4 import BeautifulSoup
+from pdf_extraction import count_pages, extract_page_range, extract_pages
 from pathlib import Path
 from langchain_community.vectorstores import FAISS
 from langchain.schema import Document
@@ -20,6 +17,50 @@ openai.api_key = st.secrets["OPENAI_API_KEY"]
 logging.basicConfig(level=logging.INFO)
 
 
+@dataclass
+class PageContent:
+    """Text and formatted tables extracted from one page (web pages and TXT files are a single page)."""
+    page_number: int
+    text: str
+    tables: list[str] = field(default_factory=list)
+    seconds: float = 0.0  # time spent extracting this page
+
+
+@dataclass
+class ExtractedDocument:
+    """Intermediate representation produced by a single parse of a file or web page.
+
+    name is the key stored in the documents table (file name or URL); source is
+    the citation attached to FAISS chunks.
+    """
+    name: str
+    source: str
+    pages: list[PageContent]
+
+    def full_text(self) -> str:
+        """Text with page markers followed by all tables, as stored in SQLite and inserted into LightRAG."""
+        text = "".join(f"\n\n[Page {page.page_number}]\n{page.text}" for page in self.pages if page.text)
+        table_texts = [
+            f"\n\n[Page {page.page_number} - Table {table_idx + 1}]\n{table}"
+            for page in self.pages
+            for table_idx, table in enumerate(page.tables)
+        ]
+        return text + "\n\n".join(table_texts)
+
+    def chunks(self) -> list[Document]:
+        """Split the cleaned page text into overlapping chunks tagged with source and page number.
+
+        Same cleaning and chunking as the streaming PDF pipeline (streaming_ingestion.chunk_pages).
+        """
+        from streaming_ingestion import chunk_pages, clean_pages  # imports db_helper, which imports this module
+
+        pages = ((page.page_number, page.text, page.tables, page.seconds) for page in self.pages)
+        return [
+            Document(page_content=text, metadata={"source": self.source, "page": page_number})
+            for text, page_number in chunk_pages(clean_pages(pages))
+        ]
+
+
 class DocumentProcessor:
     # Helper function to read text from a TXT file
     def extract_txt_content(self, file_path):
@@ -31,31 +72,37 @@ class DocumentProcessor:
     
     
 
+    def extract_pages_from_pdf(self, file) -> list[PageContent]:
+        """Extract the text and tables of every page, in parallel for large PDFs."""
+        if isinstance(file, (str, Path)):
+            pages = extract_pages(str(file))
+        else:
+            pages = extract_page_range(file, 0, count_pages(file))
+        return [PageContent(page_num, text, tables, seconds) for page_num, text, tables, seconds in pages]
+
     def extract_text_and_tables_from_pdf(self, file):
-        text = ""
-        table_texts = []
-
-        with pdfplumber.open(file) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                # Extract text
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"\n\n[Page {page_num}]\n{page_text}"
-                
-                # Extract tables
-                page_tables = page.extract_tables()
-                for table_idx, table in enumerate(page_tables):
-                    table_str = f"\n\n[Page {page_num} - Table {table_idx + 1}]\n"
-                    for row in table:
-                        cleaned_row = [cell if cell is not None else "" for cell in row]  # Replace None with ""
-                        table_str += " | ".join(cleaned_row) + "\n"
-                    table_texts.append(table_str)
-
-        # Combine extracted text and tables
-        full_text = text + "\n\n".join(table_texts)
-        return full_text
+        return ExtractedDocument(str(file), str(file), self.extract_pages_from_pdf(file)).full_text()
+
+    def extract_document(self, file_path: Path, name: str = None):
+        """Parse a PDF or TXT file once into an ExtractedDocument."""
+        name = name or file_path.name
+        if file_path.suffix.lower() == ".pdf":
+            pages = self.extract_pages_from_pdf(str(file_path))
+            source = str(file_path)
+        elif file_path.suffix.lower() == ".txt":
+            pages = [PageContent(1, self.extract_txt_content(file_path))]
+            source = name
+        else:
+            raise ValueError(f"Unsupported file format: {file_path.suffix}")
+        return ExtractedDocument(name, source, pages)
+
+    def extract_webpage_document(self, url):
+        """Fetch a web page once into an ExtractedDocument, or None if nothing could be extracted."""
+        web_content = self.process_webpage(url)
+        if not web_content:
+            return None
+        return ExtractedDocument(url, url, [PageContent(1, web_content)])
 
-    
     def preprocess_document(self, file):
         """
         Preprocess the document by extracting all text.
@@ -79,92 +126,6 @@ class DocumentProcessor:
 
 
 
-def extract_text_from_pdf(file_path: Path):
-    """Extracts text from a PDF file and splits it into chunks of max 512 characters with 200 overlap."""
-    text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            extracted_text = page.extract_text()
-            if extracted_text:
-                text += extracted_text + "\n"
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_text(text)
-    
-    return [Document(page_content=chunk, metadata={"source": str(file_path)}) for chunk in chunks]
-
-def extract_text_from_url(url: str):
-    """Extracts text from a URL and splits it into chunks of max 512 characters with 200 overlap."""
-    response = requests.get(url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    content = soup.get_text()
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_text(content)
-    
-    return [Document(page_content=chunk, metadata={"source": url}) for chunk in chunks]
-
-
-def handle_file_upload(uploaded_files, web_links, documents_dir: Path):
-    """Handles processing for both file uploads and web links."""
-
-    placeholder = st.empty()
-    
-    try:
-        processed_documents = []
-
-        # Process uploaded files
-        for uploaded_file in uploaded_files:
-            file_path = documents_dir / uploaded_file.name
-            with open(file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            documents = []  # List to store chunked documents
-
-            # Process PDF files
-            if uploaded_file.type == 'application/pdf':
-                documents = extract_text_from_pdf(file_path)  # Returns a list of Document objects
-
-            # Process Text files
-            elif uploaded_file.type == 'text/plain':
-                text = uploaded_file.getvalue().decode("utf-8")
-                text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-                chunks = text_splitter.split_text(text)
-                documents = [Document(page_content=chunk, metadata={"source": uploaded_file.name}) for chunk in chunks]
-
-            else:
-                placeholder.error(f"Unsupported file type: {uploaded_file.type}")
-                continue  # Skip this file
-            
-            # Iterate over chunked documents
-            for doc in documents:
-                processed_documents.append(doc)  # Append each chunk separately
-
-        # Process web links
-        for url in web_links:
-            url = url.strip()
-            if not url:
-                continue  # Skip empty lines
-            try:
-                documents = extract_text_from_url(url)  # Returns a list of Document objects
-
-                for doc in documents:  
-                    processed_documents.append(doc)  # Append each document separately
-
-            except Exception as e:
-                placeholder.error(f"Failed to process {url}: {str(e)}")
-
-        time.sleep(5)
-        placeholder.empty()
-        
-        return processed_documents  # Return all processed documents
-        
-    except Exception as e:
-        placeholder.error(f"An error occurred: {str(e)}")
-        return None
-
-
-        
 def create_vector_index(docs, embeddings):
     return FAISS.from_documents(docs, embeddings)
 
@@ -0,0 +1,179 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+import numpy as np
+import xxhash
+from filelock import FileLock
+from langchain_core.embeddings import Embeddings
+
+# Embedding cache storage. Kept outside analysis_workspace/ and faiss_index/ so it
+# survives "Reset Processing" and "Reset FAISS Index".
+EMBEDDING_CACHE_DIR = Path("embedding_cache")
+EMBEDDING_CACHE_DTYPE = np.float16  # half the size of float32; cosine scores move by ~1e-3
+
+
+def text_hash(text: str) -> str:
+    return xxhash.xxh3_128_hexdigest(text.encode("utf-8"))
+
+
+class EmbeddingCache:
+    """Content-addressed store of embeddings keyed by (model, dim, xxhash of text).
+
+    Vectors for each (model, dim) live in an append-only matrix file that is read
+    through np.memmap; an SQLite index maps text hashes to row numbers. Rows are
+    appended before their index entries are committed, so a crash can only leave
+    unreferenced rows behind, never an index entry pointing at a torn row.
+    """
+
+    def __init__(self, cache_dir: Path = EMBEDDING_CACHE_DIR, dtype=EMBEDDING_CACHE_DTYPE):
+        self.cache_dir = Path(cache_dir)
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.Lock()
+        self._matrices = {}  # (model, dim) -> np.memmap
+        self._initialized = False
+
+    def _init(self):
+        if self._initialized:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.cache_dir / "index.db")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    row INTEGER NOT NULL,
+                    PRIMARY KEY (model, dim, text_hash)
+                );
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+        self._initialized = True
+
+    def _matrix_path(self, model: str, dim: int) -> Path:
+        safe_model = "".join(c if c.isalnum() or c in "-_." else "_" for c in model)
+        return self.cache_dir / f"{safe_model}-{dim}.{self.dtype.name}"
+
+    def _matrix(self, model: str, dim: int, min_rows: int):
+        """Return a memmap over the matrix file covering at least min_rows rows."""
+        matrix = self._matrices.get((model, dim))
+        if matrix is None or matrix.shape[0] < min_rows:
+            path = self._matrix_path(model, dim)
+            rows = path.stat().st_size // (dim * self.dtype.itemsize) if path.exists() else 0
+            matrix = np.memmap(path, dtype=self.dtype, mode="r", shape=(rows, dim)) if rows else None
+            self._matrices[(model, dim)] = matrix
+        return matrix
+
+    def get_many(self, model: str, dim: int, hashes: list[str]) -> dict:
+        """Return {hash: float32 vector} for the hashes present in the cache."""
+        if not hashes:
+            return {}
+        with self._lock:
+            self._init()
+            conn = sqlite3.connect(self.cache_dir / "index.db")
+            try:
+                rows = {}
+                unique = list(dict.fromkeys(hashes))
+                for start in range(0, len(unique), 500):
+                    batch = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows.update(conn.execute(
+                        f"SELECT text_hash, row FROM embeddings WHERE model = ? AND dim = ? AND text_hash IN ({placeholders});",
+                        (model, dim, *batch),
+                    ).fetchall())
+            finally:
+                conn.close()
+            if not rows:
+                return {}
+            matrix = self._matrix(model, dim, max(rows.values()) + 1)
+            if matrix is None:
+                return {}
+            return {h: np.asarray(matrix[row], dtype=np.float32) for h, row in rows.items() if row < matrix.shape[0]}
+
+    def put_many(self, model: str, dim: int, hashes: list[str], vectors: np.ndarray):
+        if not hashes:
+            return
+        vectors = np.ascontiguousarray(np.asarray(vectors).reshape(len(hashes), dim), dtype=self.dtype)
+        row_bytes = dim * self.dtype.itemsize
+        with self._lock:
+            self._init()
+            path = self._matrix_path(model, dim)
+            # Cross-process lock: row numbers are derived from the file length
+            with FileLock(str(path) + ".lock"):
+                with open(path, "ab") as f:
+                    size = f.tell()
+                    if size % row_bytes:
+                        # Drop a torn row left by an interrupted writer
+                        f.truncate(size - size % row_bytes)
+                        size -= size % row_bytes
+                    f.write(vectors.tobytes())
+                    f.flush()
+                first_row = size // row_bytes
+                conn = sqlite3.connect(self.cache_dir / "index.db")
+                try:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO embeddings (model, dim, text_hash, row) VALUES (?, ?, ?, ?);",
+                        [(model, dim, h, first_row + i) for i, h in enumerate(hashes)],
+                    )
+                    conn.commit()
+                finally:
+                    conn.close()
+
+    def _split(self, model: str, dim: int, texts: list[str]):
+        hashes = [text_hash(t) for t in texts]
+        cached = self.get_many(model, dim, hashes)
+        # Embed each distinct missing text once
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = text
+        return hashes, cached, missing
+
+    def _store_and_assemble(self, model, dim, hashes, cached, missing, new_vectors) -> np.ndarray:
+        if missing:
+            new_vectors = np.asarray(new_vectors, dtype=np.float32).reshape(len(missing), dim)
+            self.put_many(model, dim, list(missing), new_vectors)
+            cached.update(zip(missing, new_vectors))
+        logging.info(f"Embedding cache ({model}): {len(hashes) - len(missing)}/{len(hashes)} hits")
+        if not hashes:
+            return np.empty((0, dim), dtype=np.float32)
+        return np.vstack([cached[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def embed(self, texts: list[str], model: str, dim: int, embed_fn) -> np.ndarray:
+        """Embed texts through the cache; embed_fn(list[str]) is only called for misses."""
+        hashes, cached, missing = self._split(model, dim, texts)
+        new_vectors = embed_fn(list(missing.values())) if missing else None
+        return self._store_and_assemble(model, dim, hashes, cached, missing, new_vectors)
+
+    async def aembed(self, texts: list[str], model: str, dim: int, aembed_fn) -> np.ndarray:
+        """Async variant of embed() for LightRAG's embedding function."""
+        hashes, cached, missing = self._split(model, dim, texts)
+        new_vectors = await aembed_fn(list(missing.values())) if missing else None
+        return self._store_and_assemble(model, dim, hashes, cached, missing, new_vectors)
+
+
+# Shared by every embedding path in the process
+embedding_cache = EmbeddingCache()
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that serves repeated texts from embedding_cache.
+
+    Only document chunks are cached. Queries go straight to the underlying model:
+    they rarely repeat, and the append-only matrix would grow with every question.
+    """
+
+    def __init__(self, underlying: Embeddings, model: str, dim: int, cache: EmbeddingCache = embedding_cache):
+        self.underlying = underlying
+        self.model = model
+        self.dim = dim
+        self.cache = cache
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.cache.embed(texts, self.model, self.dim, self.underlying.embed_documents).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.underlying.embed_query(text)
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import numpy as np
+import openai
+import streamlit as st
+import tiktoken
+from langchain_core.embeddings import Embeddings
+
+# OpenAI embeddings endpoint limits
+MAX_TOKENS_PER_TEXT = 8192          # longer inputs are truncated to this many tokens
+MAX_TOKENS_PER_REQUEST = 300_000    # total input tokens accepted in one request
+MAX_TEXTS_PER_REQUEST = 2048        # inputs accepted in one request
+
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 6
+RETRY_BASE_DELAY = 1.0              # seconds, doubled on every attempt
+RETRY_MAX_DELAY = 60.0
+
+
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def batch_by_tokens(texts: list[str], model: str,
+                    max_tokens_per_text: int = MAX_TOKENS_PER_TEXT,
+                    max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
+                    max_texts_per_request: int = MAX_TEXTS_PER_REQUEST):
+    """Pack texts into request-sized batches by token count.
+
+    Returns a list of batches, each a list of (index, text) pairs where text has
+    been truncated to max_tokens_per_text tokens.
+    """
+    encoding = _encoding(model)
+    batches, batch, batch_tokens = [], [], 0
+    for index, text in enumerate(texts):
+        tokens = encoding.encode(text or " ", disallowed_special=())
+        if len(tokens) > max_tokens_per_text:
+            logging.warning(f"Truncating embedding input {index} from {len(tokens)} to {max_tokens_per_text} tokens")
+            tokens = tokens[:max_tokens_per_text]
+            text = encoding.decode(tokens)
+        if batch and (batch_tokens + len(tokens) > max_tokens_per_request or len(batch) >= max_texts_per_request):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append((index, text or " "))
+        batch_tokens += len(tokens)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _parse_duration(value: str):
+    """Parse OpenAI reset headers such as '20ms', '1s' or '6m0.5s' into seconds."""
+    total, matched = 0.0, False
+    for amount, unit in re.findall(r"([\d.]+)(ms|s|m|h)", value):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+        matched = True
+    return total if matched else None
+
+
+def _retry_delay(error: openai.APIStatusError, attempt: int) -> float:
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) * (0.5 + random.random() / 2)
+    headers = error.response.headers if error.response is not None else {}
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    hints = [_parse_duration(headers.get(h, "")) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    hints = [h for h in hints if h is not None]
+    return max([delay] + hints)
+
+
+async def _embed_batch(client, semaphore, model: str, texts: list[str], dimensions=None) -> np.ndarray:
+    kwargs = {"dimensions": dimensions} if dimensions else {}
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                response = await client.embeddings.create(model=model, input=texts, encoding_format="float", **kwargs)
+            return np.array([item.embedding for item in sorted(response.data, key=lambda d: d.index)], dtype=np.float32)
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            if isinstance(e, openai.APIStatusError):
+                delay = _retry_delay(e, attempt)
+            else:
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+            logging.warning(f"Embedding request failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def aembed_texts(texts: list[str], model: str, dimensions: int = None, api_key: str = None,
+                       max_concurrency: int = MAX_CONCURRENT_REQUESTS) -> np.ndarray:
+    """Embed texts in token-packed batches with bounded concurrency.
+
+    Returns one contiguous float32 array of shape (len(texts), dim) in input order.
+    """
+    if not texts:
+        return np.empty((0, dimensions or 0), dtype=np.float32)
+    batches = batch_by_tokens(texts, model)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Retries are handled here so rate-limit headers can be honoured
+    async with openai.AsyncOpenAI(api_key=api_key or st.secrets["OPENAI_API_KEY"], max_retries=0) as client:
+        results = await asyncio.gather(*[
+            _embed_batch(client, semaphore, model, [text for _, text in batch], dimensions) for batch in batches
+        ])
+
+    output = np.empty((len(texts), results[0].shape[1]), dtype=np.float32)
+    for batch, vectors in zip(batches, results):
+        output[[index for index, _ in batch]] = vectors
+    logging.info(f"Embedded {len(texts)} texts with {model} in {len(batches)} requests")
+    return output
+
+
+def embed_texts(texts: list[str], model: str, dimensions: int = None, api_key: str = None) -> np.ndarray:
+    """Synchronous wrapper around aembed_texts, safe to call from inside a running event loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(aembed_texts(texts, model, dimensions, api_key))
+
+    result = {}
+
+    def run():
+        try:
+            result["value"] = asyncio.run(aembed_texts(texts, model, dimensions, api_key))
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+class OpenAIEmbeddingClient(Embeddings):
+    """LangChain Embeddings backed by the batched, rate-limit aware client above."""
+
+    def __init__(self, model: str = "text-embedding-ada-002", dimensions: int = None):
+        self.model = model
+        self.dimensions = dimensions
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return embed_texts(texts, self.model, self.dimensions).tolist()
+
+    def embed_query(self, text: str) -> list[float]:
+        return embed_texts([text], self.model, self.dimensions)[0].tolist()
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return (await aembed_texts(texts, self.model, self.dimensions)).tolist()
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await aembed_texts([text], self.model, self.dimensions))[0].tolist()
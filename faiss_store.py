@@ -0,0 +1,583 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+import faiss
+import numpy as np
+from filelock import FileLock
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+MANIFEST_NAME = "MANIFEST.json"
+DOCSTORE_NAME = "docstore.db"
+COMPACT_AFTER_DELTAS = 8    # fold deltas into the base once this many have accumulated
+COMPACT_AFTER_DELETES = 1000  # ...or once this many deleted vectors are waiting to be purged
+
+# Base segment index type: "flat" (exact), "ivfflat", "ivfpq" or "hnsw". Small corpora
+# stay flat; the base is retrained/rebuilt by compaction once it reaches ANN_MIN_VECTORS.
+FAISS_INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "flat")
+INDEX_TYPES = ("flat", "ivfflat", "ivfpq", "hnsw")
+ANN_MIN_VECTORS = int(os.environ.get("FAISS_ANN_MIN_VECTORS", 20_000))
+IVF_NPROBE = 16             # inverted lists visited per query
+PQ_SUBQUANTIZERS = 64       # must divide the embedding dimension
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 128
+MAX_TRAINING_VECTORS = 100_000
+
+# Hybrid retrieval: BM25 over chunks_fts fused with vector search by reciprocal rank
+RRF_K = 60                  # damping constant from the original RRF paper
+HYBRID_CANDIDATES = 50      # candidates taken from each ranking before fusion
+
+
+def fts_query(query: str) -> str:
+    """Turn free text into a safe FTS5 OR-query; "KAR 100-15-1" becomes "kar" OR "100 15 1"."""
+    terms = []
+    for word in query.split():
+        parts = re.findall(r"\w+", word.lower())
+        if parts:
+            terms.append('"' + " ".join(parts) + '"')
+    return " OR ".join(dict.fromkeys(terms))
+
+
+def index_type_for(count: int, configured: str = FAISS_INDEX_TYPE) -> str:
+    """Index type the base segment should have at this corpus size."""
+    if configured not in INDEX_TYPES:
+        logging.warning(f"Unknown FAISS_INDEX_TYPE '{configured}'; using flat")
+        return "flat"
+    return configured if count >= ANN_MIN_VECTORS else "flat"
+
+
+def build_index(index_type: str, vectors: np.ndarray, ids: np.ndarray):
+    """Build (and train, for IVF types) an IndexIDMap2 of the given type over vectors."""
+    n, dim = vectors.shape
+    if index_type == "hnsw":
+        inner = faiss.IndexHNSWFlat(dim, HNSW_M)
+        inner.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivfflat", "ivfpq"):
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))  # faiss wants ~39 training points per list
+        if index_type == "ivfflat":
+            inner = faiss.IndexIVFFlat(faiss.IndexFlatL2(dim), dim, nlist)
+        else:
+            inner = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, nlist, PQ_SUBQUANTIZERS, 8)
+        sample = vectors
+        if n > MAX_TRAINING_VECTORS:
+            sample = vectors[np.random.default_rng(0).choice(n, MAX_TRAINING_VECTORS, replace=False)]
+        inner.train(sample)
+    else:
+        inner = faiss.IndexFlatL2(dim)
+    index = faiss.IndexIDMap2(inner)
+    if n:
+        index.add_with_ids(vectors, ids)
+    set_search_parameters(index)
+    return index
+
+
+def set_search_parameters(index):
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = IVF_NPROBE
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = HNSW_EF_SEARCH
+
+
+def index_vectors(index):
+    """All (vectors, ids) stored in an IndexIDMap2; lossy for PQ indexes."""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+    return inner.reconstruct_n(0, index.ntotal), faiss.vector_to_array(index.id_map).astype(np.int64)
+
+
+class FaissStore:
+    """FAISS vectors in immutable base/delta segments, chunk text in an SQLite docstore.
+
+    Each segment is a faiss IndexIDMap2 file (<name>.faiss) whose ids are the primary
+    keys of docstore.db, so a search only reads text for the rows it returns.
+    MANIFEST.json lists the live base and deltas, plus the ids of deleted chunks whose
+    vectors are still in a segment (tombstones, skipped by search and purged by the next
+    compaction). It is only ever replaced atomically:
+    a crash mid-write leaves at most an unreferenced segment or docstore rows behind
+    and never touches the base. The original LangChain index.faiss/index.pkl pair is
+    migrated into this layout the first time it is opened.
+
+    One instance is meant to live for the whole process. Nothing is read until the
+    first search, and after that the segments are only re-read when the manifest on
+    disk changes (an upload, compaction or reset, possibly by another process).
+    """
+
+    def __init__(self, path: Path, embeddings):
+        self.path = Path(path)
+        self.embeddings = embeddings
+        self.base = None           # base segment, opened with mmap I/O flags
+        self.delta_index = None    # in-memory merge of the delta segments
+        self._signature = None     # manifest stat when the segments above were read
+        self._deleted = set()      # tombstoned ids still present in the segments
+        self._lock = threading.RLock()
+        self._compaction = None
+
+    # Manifest ------------------------------------------------------------
+
+    def _file_lock(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        return FileLock(str(self.path / (MANIFEST_NAME + ".lock")))
+
+    def _read_manifest(self) -> dict:
+        manifest_path = self.path / MANIFEST_NAME
+        if manifest_path.exists():
+            with open(manifest_path) as f:
+                return json.load(f)
+        return {"base": None, "deltas": [], "deleted": [], "next_segment": 1}
+
+    def _manifest_signature(self):
+        try:
+            stat = (self.path / MANIFEST_NAME).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _write_manifest(self, manifest: dict):
+        tmp_path = self.path / (MANIFEST_NAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path / MANIFEST_NAME)
+
+    # Docstore ------------------------------------------------------------
+
+    def _connect(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path / DOCSTORE_NAME)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT,
+                page INTEGER,
+                text TEXT NOT NULL,
+                metadata TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source)")
+        self._create_fts(conn)
+        return conn
+
+    def _create_fts(self, conn):
+        """Full-text index over chunk text, kept in sync with chunks by triggers."""
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        conn.executescript("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        """)
+        if not exists:
+            # Docstore created before the FTS index: index the chunks already stored
+            conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            conn.commit()
+
+    def _insert_chunks(self, texts, metadatas) -> np.ndarray:
+        """Store chunk text and metadata; returns the new row ids used as FAISS ids."""
+        conn = self._connect()
+        try:
+            ids = []
+            with conn:
+                for text, metadata in zip(texts, metadatas):
+                    cursor = conn.execute(
+                        "INSERT INTO chunks (source, page, text, metadata) VALUES (?, ?, ?, ?)",
+                        (metadata.get("source"), metadata.get("page"), text, json.dumps(metadata))
+                    )
+                    ids.append(cursor.lastrowid)
+            return np.array(ids, dtype=np.int64)
+        finally:
+            conn.close()
+
+    def source_chunks(self, source: str) -> dict:
+        """Stored chunks of one source as {id: (text, metadata)}."""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT id, text, metadata FROM chunks WHERE source = ?", (source,)).fetchall()
+        finally:
+            conn.close()
+        return {row[0]: (row[1], json.loads(row[2] or "{}")) for row in rows}
+
+    def update_metadata(self, metadatas: dict):
+        """Replace the metadata of existing chunks, given as {id: metadata}; vectors are untouched."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE chunks SET source = ?, page = ?, metadata = ? WHERE id = ?",
+                    [(m.get("source"), m.get("page"), json.dumps(m), int(i)) for i, m in metadatas.items()]
+                )
+        finally:
+            conn.close()
+
+    def get_documents(self, ids) -> dict:
+        """Fetch the chunks for the given FAISS ids as {id: Document}."""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return {}
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        finally:
+            conn.close()
+        return {row[0]: Document(page_content=row[1], metadata=json.loads(row[2] or "{}")) for row in rows}
+
+    # Segments ------------------------------------------------------------
+
+    def _save_segment(self, index, name: str):
+        """Write a segment under a temporary name, then move it into place."""
+        tmp_path = self.path / f"{name}.tmp.faiss"
+        faiss.write_index(index, str(tmp_path))
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path / f"{name}.faiss")
+
+    def _load_segment(self, name: str, mmap: bool = False):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(str(self.path / f"{name}.faiss"), flags)
+        set_search_parameters(index)
+        return index
+
+    def _remove_segment(self, name: str):
+        (self.path / f"{name}.faiss").unlink(missing_ok=True)
+
+    def _load_merged(self, base, deltas):
+        index = None
+        for name in ([base] if base else []) + list(deltas):
+            segment = self._load_segment(name)
+            if index is None:
+                index = segment
+            else:
+                index.merge_from(segment, 0)
+        return index
+
+    def _migrate_legacy_index(self):
+        """Move a LangChain index.faiss/index.pkl pair into segments + docstore (runs once).
+
+        The new layout is built in a sibling staging directory and checked before it is
+        moved in, manifest last. The legacy pair is removed only after that, so a failed
+        migration leaves it untouched and is simply retried on the next load.
+        """
+        if (self.path / MANIFEST_NAME).exists() or not (self.path / "index.pkl").exists():
+            return
+        import shutil
+        from langchain_community.vectorstores import FAISS
+
+        legacy = FAISS.load_local(
+            str(self.path), self.embeddings,
+            allow_dangerous_deserialization=True  # our own file, read one last time
+        )
+        staging = FaissStore(self.path.with_name(self.path.name + ".migrating"), self.embeddings)
+        shutil.rmtree(staging.path, ignore_errors=True)  # left by an interrupted attempt
+        try:
+            documents = [legacy.docstore.search(legacy.index_to_docstore_id[i]) for i in range(legacy.index.ntotal)]
+            ids = staging._insert_chunks([doc.page_content for doc in documents], [doc.metadata for doc in documents])
+
+            index = faiss.IndexIDMap2(faiss.IndexFlatL2(legacy.index.d))
+            index.add_with_ids(legacy.index.reconstruct_n(0, legacy.index.ntotal), ids)
+            staging._save_segment(index, "base-000001")
+            staging._write_manifest({"base": "base-000001", "base_type": "flat", "deltas": [], "next_segment": 2})
+            if staging.load() != legacy.index.ntotal:
+                raise RuntimeError(f"Migrated index holds {staging.ntotal} of {legacy.index.ntotal} vectors")
+            staging.base = staging.delta_index = None
+
+            for name in (DOCSTORE_NAME, "base-000001.faiss", MANIFEST_NAME):  # the manifest commits the move
+                os.replace(staging.path / name, self.path / name)
+        finally:
+            shutil.rmtree(staging.path, ignore_errors=True)
+
+        for name in ("index.faiss", "index.pkl"):
+            (self.path / name).unlink(missing_ok=True)
+        logging.info(f"Migrated {len(ids)} FAISS chunks from index.pkl to {DOCSTORE_NAME}")
+
+    # Public API ------------------------------------------------------------
+
+    def exists(self) -> bool:
+        if (self.path / "index.pkl").exists():
+            return True
+        manifest = self._read_manifest()
+        return manifest["base"] is not None or bool(manifest["deltas"])
+
+    @property
+    def ntotal(self) -> int:
+        return sum(index.ntotal for index in (self.base, self.delta_index) if index is not None)
+
+    def load(self) -> int:
+        """(Re)read the segments listed in the manifest; returns the number of vectors."""
+        with self._lock:
+            if (self.path / "index.pkl").exists():
+                with self._file_lock():
+                    self._migrate_legacy_index()
+            signature = self._manifest_signature()
+            manifest = self._read_manifest()
+            self.base = self._load_segment(manifest["base"], mmap=True) if manifest["base"] else None
+            self.delta_index = self._load_merged(None, manifest["deltas"])
+            self._deleted = set(manifest.get("deleted", []))
+            self._signature = signature
+            logging.info(f"Loaded FAISS index: {self.ntotal} vectors in base + {len(manifest['deltas'])} delta(s)")
+            return self.ntotal
+
+    def ensure_loaded(self) -> int:
+        """Load on first use and whenever the manifest has changed on disk."""
+        with self._lock:
+            if self._signature is None or self._signature != self._manifest_signature():
+                if self.exists():
+                    return self.load()
+                self.base = self.delta_index = None
+                self._signature = None
+                self._deleted = set()
+            return self.ntotal
+
+    def append(self, texts, vectors, metadatas) -> "FaissStore":
+        """Add pre-embedded chunks: persisted as a new delta segment, then merged in memory.
+
+        Costs O(batch) I/O regardless of corpus size.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock, self._file_lock():
+            self.ensure_loaded()
+            ids = self._insert_chunks(texts, metadatas)
+            segment = faiss.IndexIDMap2(faiss.IndexFlatL2(vectors.shape[1]))
+            segment.add_with_ids(vectors, ids)
+
+            manifest = self._read_manifest()
+            name = f"delta-{manifest['next_segment']:06d}"
+            self._save_segment(segment, name)
+            manifest["deltas"].append(name)
+            manifest["next_segment"] += 1
+            self._write_manifest(manifest)
+
+            # The in-memory copy already matches the new manifest; no reload needed
+            if self.delta_index is None:
+                self.delta_index = segment
+            else:
+                self.delta_index.merge_from(segment, 0)
+            self._signature = self._manifest_signature()
+        return self
+
+    def delete(self, ids) -> int:
+        """Delete chunks by id: their docstore rows go now, their vectors at the next compaction.
+
+        Costs O(len(ids)); the segments are not rewritten. Returns the number of chunks deleted.
+        """
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        with self._lock, self._file_lock():
+            self.ensure_loaded()
+            conn = self._connect()
+            try:
+                with conn:
+                    deleted = conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids]).rowcount
+            finally:
+                conn.close()
+
+            manifest = self._read_manifest()
+            manifest["deleted"] = sorted(set(manifest.get("deleted", [])) | set(ids))
+            self._write_manifest(manifest)
+            self._deleted.update(ids)
+            self._signature = self._manifest_signature()
+        return deleted
+
+    def search(self, query_vector, k: int = 4) -> list:
+        """Return up to k (id, distance) pairs, nearest first, across the base and deltas."""
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        hits = []
+        with self._lock:
+            self.ensure_loaded()
+            fetch = k + len(self._deleted)  # tombstoned vectors may take some of the top places
+            for index in (self.base, self.delta_index):
+                if index is not None and index.ntotal:
+                    distances, ids = index.search(query, min(fetch, index.ntotal))
+                    hits.extend(
+                        (int(i), float(d)) for i, d in zip(ids[0], distances[0]) if i != -1 and i not in self._deleted
+                    )
+        return sorted(hits, key=lambda hit: hit[1])[:k]
+
+    def keyword_search(self, query: str, k: int = 4) -> list:
+        """Return up to k (id, bm25) pairs from the full-text index, best first."""
+        match = fts_query(query)
+        if not match:
+            return []
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT rowid, bm25(chunks_fts) AS score FROM chunks_fts WHERE chunks_fts MATCH ? "
+                "ORDER BY score LIMIT ?", (match, k)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def hybrid_search(self, query: str, k: int = 4, candidates: int = HYBRID_CANDIDATES) -> list:
+        """BM25 and vector rankings fused with reciprocal-rank fusion; returns k Documents.
+
+        Exact terms such as regulation numbers are found by BM25 even when their
+        embedding is not close to the question's.
+        """
+        rankings = [
+            [i for i, _ in self.search(self.embeddings.embed_query(query), candidates)],
+            [i for i, _ in self.keyword_search(query, candidates)],
+        ]
+        scores = {}
+        for ranking in rankings:
+            for rank, i in enumerate(ranking):
+                scores[i] = scores.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:k]
+        documents = self.get_documents(best)
+        return [documents[i] for i in best if i in documents]
+
+    def similarity_search_with_score(self, query: str, k: int = 4) -> list:
+        hits = self.search(self.embeddings.embed_query(query), k)
+        documents = self.get_documents([i for i, _ in hits])
+        return [(documents[i], distance) for i, distance in hits if i in documents]
+
+    def similarity_search(self, query: str, k: int = 4) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def as_retriever(self, search_type: str = "similarity", search_kwargs: dict = None) -> "FaissRetriever":
+        return FaissRetriever(store=self, search_type=search_type, k=(search_kwargs or {}).get("k", 4))
+
+    def compact(self):
+        """Fold the current deltas into a new base segment and purge deleted vectors.
+
+        The base keeps its index type and the delta vectors are simply added to it (and
+        deleted ids removed from it), unless the corpus size or FAISS_INDEX_TYPE calls for
+        a different type, or the base is HNSW (which cannot remove vectors), in which case
+        the base is rebuilt (and retrained) from every live vector. The work runs without
+        holding the lock; deltas appended and chunks deleted meanwhile stay in the manifest
+        and are picked up by the next compaction.
+        """
+        with self._lock, self._file_lock():
+            manifest = self._read_manifest()
+            base, deltas = manifest["base"], list(manifest["deltas"])
+            base_type = manifest.get("base_type", "flat")
+            deleted = np.array(manifest.get("deleted", []), dtype=np.int64)
+            if base is None and not deltas:
+                return
+            if not deltas and not len(deleted) and base_type == index_type_for(self.ensure_loaded()):
+                return
+            name = f"base-{manifest['next_segment']:06d}"
+            manifest["next_segment"] += 1
+            self._write_manifest(manifest)  # reserve the segment number
+
+        def live(vectors, ids):
+            keep = ~np.isin(ids, deleted)
+            return vectors[keep], ids[keep]
+
+        start = time.perf_counter()
+        merged = self._load_segment(base) if base else None
+        delta_index = self._load_merged(None, deltas)
+        count = sum(index.ntotal for index in (merged, delta_index) if index is not None) - len(deleted)
+        target_type = index_type_for(count)
+
+        if merged is not None and base_type == target_type and (base_type != "hnsw" or not len(deleted)):
+            if len(deleted):
+                merged.remove_ids(deleted)
+            if delta_index is not None:
+                merged.add_with_ids(*live(*index_vectors(delta_index)))
+        else:
+            parts = [live(*index_vectors(index)) for index in (merged, delta_index) if index is not None]
+            if base_type == "ivfpq":
+                logging.warning("Rebuilding the FAISS base from IVF-PQ codes; vectors are approximate")
+            merged = build_index(target_type, np.vstack([v for v, _ in parts]), np.concatenate([i for _, i in parts]))
+            logging.info(f"Rebuilt FAISS base as {target_type} over {merged.ntotal} vectors in {time.perf_counter() - start:.1f}s")
+        self._save_segment(merged, name)
+
+        with self._lock, self._file_lock():
+            manifest = self._read_manifest()
+            if manifest["base"] != base or not set(deltas) <= set(manifest["deltas"]):
+                # The index was reset or compacted elsewhere while we were merging
+                self._remove_segment(name)
+                return
+            manifest["base"] = name
+            manifest["base_type"] = target_type
+            manifest["deltas"] = [d for d in manifest["deltas"] if d not in deltas]
+            purged = set(deleted.tolist())
+            manifest["deleted"] = [i for i in manifest.get("deleted", []) if i not in purged]
+            self._write_manifest(manifest)
+
+        for old in ([base] if base else []) + deltas:
+            self._remove_segment(old)
+        logging.info(f"Compacted {len(deltas)} FAISS delta segment(s) into {name}, purging {len(deleted)} deleted vector(s)")
+
+    def compact_in_background(self, min_deltas: int = COMPACT_AFTER_DELTAS, min_deleted: int = COMPACT_AFTER_DELETES):
+        """Start compaction on a background thread once enough deltas or deleted vectors
+        have accumulated, or the base needs rebuilding as a different index type."""
+        with self._lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            manifest = self._read_manifest()
+            needs_rebuild = manifest.get("base_type", "flat") != index_type_for(self.ensure_loaded())
+            if len(manifest["deltas"]) < min_deltas and len(manifest.get("deleted", [])) < min_deleted and not needs_rebuild:
+                return
+
+            def run():
+                try:
+                    self.compact()
+                except Exception as e:
+                    logging.error(f"FAISS compaction failed: {e}")
+
+            self._compaction = threading.Thread(target=run, name="faiss-compaction", daemon=True)
+            self._compaction.start()
+
+    def reset(self):
+        """Delete every segment and the docstore, and forget the in-memory index.
+
+        A background compaction is waited for first, and the files are removed under the
+        file lock, which itself is kept, so a compaction running in another process sees
+        the reset when it commits and drops its segment. Segment numbers carry on across
+        the reset so that compaction cannot mistake newly appended deltas for its own.
+        """
+        import shutil
+
+        while True:
+            with self._lock:  # compact_in_background needs the lock to start another thread
+                compaction = self._compaction
+                if compaction is None or not compaction.is_alive():
+                    with self._file_lock():
+                        next_segment = self._read_manifest()["next_segment"]
+                        for entry in self.path.iterdir():
+                            if entry.name == MANIFEST_NAME + ".lock":
+                                continue
+                            if entry.is_dir():
+                                shutil.rmtree(entry)
+                            else:
+                                entry.unlink()
+                        self._write_manifest({"base": None, "deltas": [], "deleted": [], "next_segment": next_segment})
+                    self.base = self.delta_index = None
+                    self._signature = None
+                    self._deleted = set()
+                    return
+            compaction.join()  # outside the lock, which compaction takes to commit
+
+
+class FaissRetriever(BaseRetriever):
+    """LangChain retriever over a FaissStore; reads text only for the top-k ids.
+
+    search_type is "similarity" (vectors only) or "hybrid" (BM25 + vectors, fused with RRF).
+    """
+
+    store: Any
+    search_type: str = "similarity"
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> list[Document]:
+        if self.search_type == "hybrid":
+            return self.store.hybrid_search(query, self.k)
+        return self.store.similarity_search(query, self.k)
@@ -45,27 +45,45 @@
 
 
 
+import logging
 from pathlib import Path
-import time
+import numpy as np
 import streamlit as st
 from ingress import ingress_file_doc
+from db_helper import bump_corpus_version
+from dedup import forget, forget_source, reset as reset_signatures
+from embedding_cache import CachedEmbeddings
+from embedding_client import OpenAIEmbeddingClient
+from faiss_store import FaissStore
+from notifications import notify
+from context_packing import CONTEXT_TOKEN_BUDGET, PackedRetriever, count_tokens, last_packing_stats
+from langchain.chains.qa_with_sources.stuff_prompt import PROMPT as QA_PROMPT
 from langchain.chains.qa_with_sources.retrieval import RetrievalQAWithSourcesChain
-from langchain_openai import OpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
+from langchain_openai import OpenAI
 
 
+logger = logging.getLogger(__name__)
+
 # Define FAISS index storage path
 FAISS_INDEX_PATH = Path("faiss_index")
 
-# Load OpenAI Embeddings
-embeddings = OpenAIEmbeddings()
+# Candidate chunks for the QA chain. Hybrid BM25 + vector retrieval puts exact-term
+# matches at the top, so far fewer candidates are needed than with vectors alone; they
+# are then merged, de-duplicated and cut to the prompt token budget by context_packing.
+RETRIEVER_K = 20
+
+# Load OpenAI Embeddings (served from the shared embedding cache on repeat texts)
+embeddings = CachedEmbeddings(OpenAIEmbeddingClient("text-embedding-ada-002"), model="text-embedding-ada-002", dim=1536)
+
+# Base segment + append-only deltas with text in an SQLite docstore; uploads never rewrite the whole index
+faiss_store = FaissStore(FAISS_INDEX_PATH, embeddings)
 
 
-def process_files_and_links(files, web_links):
+def process_files_and_links(files, web_links, documents_dir: Path = Path("documents")):
     with st.spinner("Processing..."):
         # ✅ Process files
         for uploaded_file in files:
-            process_file(uploaded_file)  
+            process_file(uploaded_file, documents_dir)
 
         # ✅ Process web links
         if web_links:
@@ -73,38 +91,38 @@ def process_files_and_links(files, web_links):
 
     st.session_state["files_processed"] = True
 
-def process_file(uploaded_file):
+def process_file(uploaded_file, documents_dir: Path = Path("documents")):
     try:
         file_name = uploaded_file.name
         st.session_state["file_name"] = file_name
 
-        temp_dir = Path("./temp_files")
-        temp_dir.mkdir(parents=True, exist_ok=True)
+        # Written once; the same copy is parsed for SQLite, LightRAG and FAISS
+        documents_dir.mkdir(parents=True, exist_ok=True)
 
-        file_path = temp_dir / file_name
+        file_path = documents_dir / file_name
         with open(file_path, "wb") as f:
             f.write(uploaded_file.getvalue())
 
         response = ingress_file_doc(file_name=file_name, file_path=file_path)
         if "error" in response:
-            st.error(f"File processing error: {response['error']}")
+            notify(f"File processing error: {response['error']}", "error")
         else:
-            st.success(f"✅ File '{file_name}' processed successfully!")
+            notify(f"File '{file_name}' processed successfully!", "success")
 
     except Exception as e:
-        st.error(f"❌ Connection error: {e}")
+        notify(f"Connection error: {e}", "error")
 
 def process_web_links(web_links):
     """Processes web links separately."""
     try:
         response = ingress_file_doc(web_links=web_links)
         if "error" in response:
-            st.error(f"Web link processing error: {response['error']}")
+            notify(f"Web link processing error: {response['error']}", "error")
         else:
-            st.success(f"✅ Web links processed successfully!")
+            notify("Web links processed successfully!", "success")
 
     except Exception as e:
-        st.error(f"❌ Connection error: {e}")
+        notify(f"Connection error: {e}", "error")
 
 # Function to create or load FAISS index
 def load_or_create_faiss_index(documents):
@@ -112,82 +130,176 @@ def load_or_create_faiss_index(documents):
     # Ensure the directory exists
     FAISS_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
     
-    if FAISS_INDEX_PATH.exists():
-        placeholder = st.empty()
-        placeholder.write("✅ FAISS index found. Loading...")
-        time.sleep(5)
-        placeholder.empty()
-        return FAISS.load_local(str(FAISS_INDEX_PATH), embeddings, allow_dangerous_deserialization=True)
-    st.write("⚠️ FAISS index not found.")
+    if faiss_store.exists():
+        notify("FAISS index found.", "success")
+        return faiss_store  # segments are read lazily on the first search
+    notify("FAISS index not found.", "warning")
     
     
     if not documents:
-        print("⚠️ No documents to index. Skipping FAISS initialization.")
+        logger.debug("⚠️ No documents to index. Skipping FAISS initialization.")
         return None
     
     texts = [doc.page_content for doc in documents]
     metadatas = [{"source": doc.metadata.get("source", "Unknown")} for doc in documents]
     
     if not texts:
-        print("⚠️ No valid text found in documents. Skipping FAISS initialization.")
+        logger.debug("⚠️ No valid text found in documents. Skipping FAISS initialization.")
         return None
     
-    vector_store = FAISS.from_texts(texts, embeddings, metadatas=metadatas)
-    vector_store.save_local(str(FAISS_INDEX_PATH))
-    return vector_store
+    return faiss_store.append(texts, embeddings.embed_documents(texts), metadatas)
 
 # Load or initialize FAISS index
 documents = []  # Populate this list dynamically\if "vector_store" not in st.session_state:
 st.session_state["vector_store"] = load_or_create_faiss_index(documents)
 
+# Load LLM
+llm = OpenAI(temperature=0.7)
+
+# The QA chain "stuffs" every packed block into one call, which holds its prompt template,
+# the question, the blocks and the completion; the packed context gets what is left of the
+# model's window. (from_llm would build a map-reduce chain: one LLM call per block.)
+QA_CONTEXT_WINDOW = llm.modelname_to_contextsize(llm.model_name)
+QA_RESERVED_TOKENS = max(llm.max_tokens, 0) + count_tokens(QA_PROMPT.template, llm.model_name)
+
+
+def _packed_retriever(store):
+    return PackedRetriever(
+        retriever=store.as_retriever(search_type="hybrid", search_kwargs={"k": RETRIEVER_K}),
+        max_tokens=CONTEXT_TOKEN_BUDGET,
+        context_window=QA_CONTEXT_WINDOW,
+        reserved_tokens=QA_RESERVED_TOKENS,
+        model=llm.model_name,
+    )
+
+
+def _qa_chain(retriever):
+    return RetrievalQAWithSourcesChain.from_chain_type(
+        llm=llm, chain_type="stuff", retriever=retriever, chain_type_kwargs={"prompt": QA_PROMPT}
+    )
+
+
 vector_store = st.session_state["vector_store"]
 if vector_store:
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 50})
+    retriever = _packed_retriever(vector_store)
 else:
     retriever = None
-    print("📢 No vector store created. Waiting for document upload.")
+    logger.debug("📢 No vector store created. Waiting for document upload.")
 
-# Load LLM
-llm = OpenAI(temperature=0.7)
 if retriever:
-    chain = RetrievalQAWithSourcesChain.from_llm(llm=llm, retriever=retriever)
+    chain = _qa_chain(retriever)
 else:
-    print("🚨 No retriever available! Waiting for document upload.")
+    logger.debug("🚨 No retriever available! Waiting for document upload.")
     chain = None
 
 def run_qa_chain(query):
     qa_results = chain.invoke({"question": query})
     return qa_results
 
+# Errors propagate: the answer pipeline reports the failed branch and does not cache the answer
 def retrieve_answers(query):
-    print(f"Retrieving answers for: {query}")
-    try:
-        response = run_qa_chain(query)
-        print(f"Chain Response: {response}")
-
-        if not isinstance(response, dict):
-            return {"answer": "⚠️ Unexpected response format.", "sources": "N/A"}
-
-        return response
-    except Exception as e:
-        return {"answer": f"⚠️ Error: {str(e)}", "sources": "N/A"}
-
-# Function to add new documents without overwriting
-def add_documents_to_faiss(new_documents):
+    logger.debug(f"Retrieving answers for: {query}")
+    if chain is None:
+        raise RuntimeError("No documents have been indexed yet.")
+    response = run_qa_chain(query)
+    logger.debug(f"Chain Response: {response}")
+
+    if not isinstance(response, dict):
+        raise TypeError(f"Unexpected QA chain response: {type(response).__name__}")
+
+    # The chain ran the packed retriever on this thread
+    response["context_tokens"] = last_packing_stats()
+    return response
+
+def _use_new_vector_store(store):
+    """Point the retriever and QA chain at a store created after import."""
+    global vector_store, retriever, chain
+    vector_store = store
+    st.session_state["vector_store"] = vector_store
+    retriever = _packed_retriever(vector_store)
+    chain = _qa_chain(retriever)
+
+# Function to add new documents without overwriting; returns the number of chunks indexed
+def add_documents_to_faiss(new_documents, chunk_filter=None):
+    if chunk_filter is not None:
+        # Repeats of chunks already indexed from the same source are not embedded again
+        sources = [doc.metadata.get("source", "Unknown") for doc in new_documents]
+        new_documents = [new_documents[i] for i in chunk_filter.keep([doc.page_content for doc in new_documents], sources)]
     if new_documents:
-        vector_store.add_texts(
-            texts=[doc.page_content for doc in new_documents],
-            metadatas=[{"source": doc.metadata.get("source", "Unknown")} for doc in new_documents]
-        )
-        vector_store.save_local(str(FAISS_INDEX_PATH))  # Save FAISS index persistently
-        st.success("New documents added successfully! ✅")
+        texts = [doc.page_content for doc in new_documents]
+        metadatas = [{**doc.metadata, "source": doc.metadata.get("source", "Unknown")} for doc in new_documents]
+        add_embeddings_to_faiss(texts, embeddings.embed_documents(texts), metadatas)
+        save_faiss_index()
+        notify("New documents added successfully!", "success")
+    return len(new_documents)
+
+# Re-index one source from its new chunks; unchanged chunk text keeps its vectors
+def update_faiss_source(source, new_documents, chunk_filter=None):
+    stored = faiss_store.source_chunks(source)  # id -> (text, metadata)
+    stored_ids = {}
+    for chunk_id, (text, _) in stored.items():
+        stored_ids.setdefault(text, chunk_id)
+    new_by_text = {doc.page_content: doc for doc in new_documents}
+
+    retired = [chunk_id for chunk_id, (text, _) in stored.items() if stored_ids[text] != chunk_id or text not in new_by_text]
+    added = [doc for text, doc in new_by_text.items() if text not in stored_ids]
+    moved = {  # same text on another page after the revision
+        stored_ids[text]: {**doc.metadata, "source": source}
+        for text, doc in new_by_text.items()
+        if text in stored_ids and stored[stored_ids[text]][1].get("page") != doc.metadata.get("page")
+    }
+
+    # Fingerprints of the old versions would make reformatted replacements look like repeats
+    forget(source, [stored[chunk_id][0] for chunk_id in retired])
+    indexed = add_documents_to_faiss(added, chunk_filter=chunk_filter)  # repeats within the source are dropped
+    if chunk_filter is not None:
+        chunk_filter.record()
+    faiss_store.update_metadata(moved)
+    faiss_store.delete(retired)
+    faiss_store.compact_in_background()
+    bump_corpus_version()
+    return {"added": indexed, "retired": len(retired), "kept": len(new_by_text) - len(added)}
+
+# Remove every chunk of one source; returns the number of chunks removed
+def remove_faiss_source(source):
+    removed = faiss_store.delete(list(faiss_store.source_chunks(source)))
+    forget_source(source)
+    if removed:
+        faiss_store.compact_in_background()
+        bump_corpus_version()
+    return removed
+
+# Batches waiting to be written as one delta segment by save_faiss_index(); vectors as float32 arrays.
+# A segment is written every FLUSH_CHUNKS chunks, so a large document never holds more than that in memory.
+FLUSH_CHUNKS = 4096
+_pending_texts, _pending_vectors, _pending_metadatas = [], [], []
+
+# Function to add one batch of already-embedded chunks; call save_faiss_index() when the document is done
+def add_embeddings_to_faiss(texts, vectors, metadatas):
+    _pending_texts.extend(texts)
+    _pending_vectors.append(np.asarray(vectors, dtype=np.float32))
+    _pending_metadatas.extend(metadatas)
+    if len(_pending_texts) >= FLUSH_CHUNKS:
+        save_faiss_index()
+
+def save_faiss_index():
+    if not _pending_texts:
+        return
+    store = faiss_store.append(list(_pending_texts), np.vstack(_pending_vectors), list(_pending_metadatas))
+    _pending_texts.clear()
+    _pending_vectors.clear()
+    _pending_metadatas.clear()
+    if store is not vector_store:
+        _use_new_vector_store(store)
+    bump_corpus_version()
+    faiss_store.compact_in_background()
 
 # Function to clear FAISS index
 def clear_faiss_index():
-    global vector_store
-    if FAISS_INDEX_PATH.exists():
-        import shutil
-        shutil.rmtree(FAISS_INDEX_PATH)
-    vector_store = FAISS(embeddings)
-    st.session_state["vector_store"] = vector_store
-    st.success("FAISS index cleared successfully!")
\ No newline at end of file
+    global vector_store, retriever, chain
+    faiss_store.reset()
+    reset_signatures()  # otherwise re-uploaded chunks would be skipped as duplicates of the cleared ones
+    bump_corpus_version()
+    vector_store = retriever = chain = None
+    st.session_state["vector_store"] = None
+    notify("FAISS index cleared successfully!", "success")
@@ -0,0 +1,167 @@
+# Durable ingestion queue. Uploads are recorded in the ingestion_jobs table of files.db
+# and parsed/embedded/inserted by a background worker thread, so the admin's session is
+# not blocked and a browser refresh does not kill a half-finished upload. Jobs that were
+# running when the process died are picked up again when the worker next starts.
+import json
+import logging
+import sqlite3
+import threading
+import time
+import traceback
+from db_helper import connection, initialize_database, transaction
+
+JOB_POLL_SECONDS = 2        # how often the sidebar refreshes job progress
+WORKER_IDLE_SECONDS = 1     # how long the worker sleeps when the queue is empty
+MAX_JOB_ATTEMPTS = 3        # a job that keeps dying with the process is failed, not retried forever
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+
+
+def _enqueue(file_name=None, file_path=None, web_links=None, action="ingest"):
+    now = time.time()
+    with transaction() as conn:
+        job_id = conn.execute("""
+            INSERT INTO ingestion_jobs (file_name, file_path, web_links, action, status, message, created_at, updated_at)
+            VALUES (?, ?, ?, ?, 'queued', 'Waiting for worker', ?, ?);
+        """, (file_name, file_path, json.dumps(web_links) if web_links else None, action, now, now)).lastrowid
+    _wake.set()
+    return job_id
+
+
+def enqueue_file(file_name: str, file_path, update: bool = False) -> int:
+    """Queue a file already saved under documents/; returns the job id, or None if it is already queued.
+
+    update=True re-ingests a revised version of a stored file chunk by chunk (see ingress.update_file_doc).
+    """
+    if has_active_job(file_name):
+        return None
+    return _enqueue(file_name=file_name, file_path=str(file_path), action="update" if update else "ingest")
+
+
+def enqueue_delete(file_name: str) -> int:
+    """Queue the removal of a stored document from SQLite, FAISS and LightRAG (see ingress.delete_file_doc)."""
+    if has_active_job(file_name):
+        return None
+    return _enqueue(file_name=file_name, action="delete")
+
+
+def enqueue_links(web_links: list) -> int:
+    """Queue a batch of web links as one job."""
+    links = [link.strip() for link in web_links if link.strip()]
+    return _enqueue(web_links=links) if links else None
+
+
+def has_active_job(file_name: str) -> bool:
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM ingestion_jobs WHERE file_name = ? AND status IN (?, ?);", (file_name, *ACTIVE_STATUSES)
+        ).fetchone()
+    return row is not None
+
+
+def list_jobs(limit: int = 20) -> list[dict]:
+    """Most recent jobs first, as dicts."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        rows = cursor.execute("SELECT * FROM ingestion_jobs ORDER BY id DESC LIMIT ?;", (limit,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def update_job(job_id: int, progress: float = None, message: str = None, status: str = None):
+    with transaction() as conn:
+        conn.execute("""
+            UPDATE ingestion_jobs
+            SET progress = COALESCE(?, progress), message = COALESCE(?, message),
+                status = COALESCE(?, status), updated_at = ?
+            WHERE id = ?;
+        """, (progress, message, status, time.time(), job_id))
+
+
+def _resume_interrupted_jobs():
+    """Requeue jobs left 'running' by a previous process; give up on ones that keep failing."""
+    with transaction() as conn:
+        conn.execute("""
+            UPDATE ingestion_jobs SET status = 'failed', message = 'Interrupted too many times', updated_at = ?
+            WHERE status = 'running' AND attempts >= ?;
+        """, (time.time(), MAX_JOB_ATTEMPTS))
+        resumed = conn.execute("""
+            UPDATE ingestion_jobs SET status = 'queued', progress = 0, message = 'Resumed after restart', updated_at = ?
+            WHERE status = 'running';
+        """, (time.time(),)).rowcount
+    if resumed:
+        logging.info(f"Resumed {resumed} interrupted ingestion job(s)")
+
+
+def _claim_next_job():
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        row = cursor.execute("SELECT * FROM ingestion_jobs WHERE status = 'queued' ORDER BY id LIMIT 1;").fetchone()
+        if row is None:
+            return None
+        cursor.execute("""
+            UPDATE ingestion_jobs SET status = 'running', attempts = attempts + 1, message = 'Starting', updated_at = ?
+            WHERE id = ?;
+        """, (time.time(), row["id"]))
+    return dict(row)
+
+
+def _run_job(job: dict):
+    from ingress import delete_file_doc, ingress_file_doc, update_file_doc
+
+    def on_progress(progress: float, message: str):
+        update_job(job["id"], progress=progress, message=message)
+
+    try:
+        if job["action"] == "update":
+            response = update_file_doc(job["file_name"], job["file_path"], on_progress=on_progress)
+        elif job["action"] == "delete":
+            response = delete_file_doc(job["file_name"], on_progress=on_progress)
+        else:
+            response = ingress_file_doc(
+                file_name=job["file_name"],
+                file_path=job["file_path"],
+                web_links=json.loads(job["web_links"]) if job["web_links"] else None,
+                on_progress=on_progress,
+            )
+    except Exception as e:
+        traceback.print_exc()
+        response = {"error": str(e)}
+
+    if "error" in response:
+        update_job(job["id"], status="failed", message=response["error"])
+        print(f"❌ Ingestion job {job['id']} failed: {response['error']}")
+    else:
+        update_job(job["id"], status="done", progress=1.0, message=response.get("message", "Done"))
+        print(f"✅ Ingestion job {job['id']} done")
+
+
+def _work():
+    _resume_interrupted_jobs()
+    while True:
+        job = _claim_next_job()
+        if job is None:
+            _wake.wait(WORKER_IDLE_SECONDS)
+            _wake.clear()
+            continue
+        _run_job(job)
+
+
+def start_worker():
+    """Start the process-wide ingestion worker once; later calls are no-ops.
+
+    A single worker runs the jobs one at a time: ingestion shares the FAISS write
+    buffers and the LightRAG workspace, which are not safe to fill concurrently.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        initialize_database()
+        _worker = threading.Thread(target=_work, name="ingestion-worker", daemon=True)
+        _worker.start()
@@ -5,7 +5,9 @@
 # from db_helper import insert_file_metadata
 # from document_processor import DocumentProcessor
 
-# # Initialize document processor
+# logger = logging.getLogger(__name__)
+
+# Initialize document processor
 # process_document = DocumentProcessor()
 
 # def ingress_file_doc(file_name: str, file_path: str = None, web_links: list = None):
@@ -75,84 +77,305 @@
 
 
 
-import sqlite3
+import logging
 import traceback
-import streamlit as st
 from pathlib import Path
-from db_helper import insert_file_metadata
+from db_helper import (
+    bump_corpus_version, check_if_file_exists, delete_file, find_duplicate_document, get_document_source,
+    get_document_text, insert_documents, update_document,
+)
+from dedup import RepeatedChunkFilter, file_hash
 from do_spaces import upload_file
-from document_processor import DocumentProcessor
+from notifications import notify
+from document_processor import DocumentProcessor, ExtractedDocument, PageContent
+from pdf_extraction import iter_pages
+from streaming_ingestion import FullTextWriter, stream_pages_into_index
 
 # Initialize document processor
 process_document = DocumentProcessor()
 
-def ingress_file_doc(file_name: str = None, file_path: str = None, web_links: list = None):
-    from app import RAGFactory
+# Stream PDFs page -> clean -> chunk -> embed -> FAISS instead of materializing the whole document first
+STREAMING_INGESTION = True
 
-    try:
-        conn = sqlite3.connect("files.db", check_same_thread=False)
-        cursor = conn.cursor()
+def ingress_file_doc(file_name: str = None, file_path: str = None, web_links: list = None, on_progress=None):
+    """Parse a file and/or web links once and fan the result out to SQLite, LightRAG and FAISS.
 
-        text_content = []
+    on_progress(fraction, message) is called as the stages complete (see ingestion_jobs.py).
+    """
+    from rag_factory import RAGFactory
+    from inference import add_documents_to_faiss, add_embeddings_to_faiss, embeddings, remove_faiss_source, save_faiss_index
+    from lightrag_updates import insert_documents as insert_lightrag_documents
+
+    def report(progress, message):
+        if on_progress:
+            on_progress(progress, message)
+
+    try:
+        extracted_documents = []
+        unindexed_documents = []  # not yet in FAISS (the streaming pipeline indexes PDFs as it parses)
+        source_hashes = {}  # document name -> hash of the uploaded file
+        blobs = {}          # document name -> BlobWriter holding the text of a streamed PDF
+        duplicates = []     # (name, name of the stored document with the same content)
+        chunk_filter = RepeatedChunkFilter()
 
         # ✅ If a file is uploaded, process it
         if file_path:
-            cursor.execute("SELECT file_name FROM documents WHERE file_name = ?", (file_name,))
-            if cursor.fetchone():
-                st.sidebar.warning(f"⚠️ File '{file_name}' has already been uploaded.")
+            if check_if_file_exists(file_name):
+                notify(f"File '{file_name}' has already been uploaded.", "warning")
                 return {"error": "File already exists."}
 
-            file_path_str = str(file_path)
-            if file_path_str.endswith(".pdf"):
-                extracted_text = process_document.extract_text_and_tables_from_pdf(file_path_str)
-                if extracted_text:
-                    text_content.append(extracted_text)
-            elif file_path_str.endswith(".txt"):
-                text_content.append(process_document.extract_txt_content(file_path_str))
+            # The same file under another name: nothing to parse, embed or extract
+            source_hashes[file_name] = file_hash(file_path)
+            duplicate = find_duplicate_document(source_hash=source_hashes[file_name])
+            if duplicate:
+                message = f"'{file_name}' is identical to '{duplicate}'; skipped."
+                notify(message, "warning")
+                return {"success": True, "message": message}
+
+            if STREAMING_INGESTION and Path(file_path).suffix.lower() == ".pdf":
+                # FAISS is fed page by page while the PDF is still being parsed, and the
+                # text is compressed as it arrives instead of keeping every page around
+                full_text = FullTextWriter()
+
+                def on_page(page):
+                    full_text.add(page)
+                    report(0.05, f"Parsed and embedded {full_text.pages} pages")
+
+                report(0.05, "Parsing PDF")
+                remove_faiss_source(str(file_path))  # chunks left by an attempt that failed before its row was saved
+                stream_pages_into_index(
+                    iter_pages(str(file_path)), str(file_path),
+                    embeddings.embed_documents, add_embeddings_to_faiss, on_page=on_page, chunk_filter=chunk_filter,
+                )
+                save_faiss_index()
+                chunk_filter.record()
+                blobs[file_name] = full_text.close()
+                extracted_documents.append(ExtractedDocument(file_name, str(file_path), []))  # text is in blobs
             else:
-                return {"error": "❌ Unsupported file format."}
+                report(0.05, "Parsing file")
+                try:
+                    extracted_documents.append(process_document.extract_document(Path(file_path), file_name))
+                except ValueError:
+                    return {"error": "❌ Unsupported file format."}
+                unindexed_documents.append(extracted_documents[-1])
 
         # ✅ If web links are provided, scrape them
         if web_links:
             for link in web_links:
-                cursor.execute("SELECT file_name FROM documents WHERE file_name = ?", (link,))
-                if cursor.fetchone():
-                    st.sidebar.warning(f"⚠️ Web link '{link}' has already been processed.")
+                link = link.strip()
+                if not link:
+                    continue  # Skip empty lines
+
+                if check_if_file_exists(link):
+                    notify(f"Web link '{link}' has already been processed.", "warning")
                     continue  # Skip duplicate links
 
-                web_content = process_document.process_webpage(link)
-                if web_content:
-                    text_content.append(web_content)
+                report(0.05, f"Scraping {link}")
+                web_document = process_document.extract_webpage_document(link)
+                if web_document:
+                    extracted_documents.append(web_document)
+                    unindexed_documents.append(web_document)
                 else:
-                    st.sidebar.error(f"❌ Failed to scrape content from {link}")
+                    notify(f"Failed to scrape content from {link}", "error")
+
+        # ✅ Drop documents whose text is already stored (e.g. one page reached through two URLs)
+        unique_documents, seen_texts = [], {}
+        for document in extracted_documents:
+            text = blobs[document.name].read() if document.name in blobs else document.full_text()
+            duplicate = find_duplicate_document(text=text) or seen_texts.get(text)
+            if duplicate:
+                duplicates.append((document.name, duplicate))
+                continue
+            seen_texts[text] = document.name
+            unique_documents.append((document, text))
+        unindexed_documents = [document for document in unindexed_documents if document.name in seen_texts.values()]
+        extracted_documents = [document for document, _ in unique_documents]
+        text_content = [text for _, text in unique_documents]
+        for name, duplicate in duplicates:
+            notify(f"'{name}' has the same content as '{duplicate}'; skipped.", "warning")
 
         # ✅ Ensure at least some content was extracted
-        if not text_content:
+        if not any(text_content):
+            if duplicates:
+                return {"success": True, "message": f"Skipped {len(duplicates)} duplicate document(s)."}
             return {"error": "No valid content extracted from file or web links."}
 
-        # ✅ Insert into the database
-        for content in text_content:
-            insert_file_metadata(file_name or "web_link", content)
-
         # ✅ Create working directory
         working_dir = Path("./analysis_workspace")
         working_dir.mkdir(parents=True, exist_ok=True)
 
         # ✅ Insert into LightRAG
+        report(0.35, "Building knowledge graph")
         rag = RAGFactory.create_rag(str(working_dir))
-        rag.insert(text_content)
+        # Records which chunks each document produced, so updates and deletes stay targeted
+        insert_lightrag_documents(rag, [(document.name, text) for document, text in unique_documents])
+        RAGFactory.invalidate(str(working_dir))  # Queries must pick up the new graph/vectors
+
+        # ✅ Insert chunks of the same extraction into FAISS
+        report(0.8, "Embedding chunks")
+        for document in unindexed_documents:
+            remove_faiss_source(document.source)  # chunks left by an attempt that failed before its row was saved
+        add_documents_to_faiss(
+            [chunk for document in unindexed_documents for chunk in document.chunks()], chunk_filter=chunk_filter
+        )
+        chunk_filter.record()
+
+        report(0.9, "Uploading workspace")
+        _upload_workspace(working_dir)
+
+        # ✅ Insert into the database last: a row means every step above finished, so a job
+        # retried after a failure is not rejected as "already exists". LightRAG skips texts it
+        # already processed and leftover FAISS chunks were removed above, so retries are safe.
+        report(0.95, "Saving text")
+        # One row per file or URL; identical texts share one compressed blob
+        insert_documents([
+            (document.name, blobs.get(document.name, text), source_hashes.get(document.name), document.source)
+            for document, text in zip(extracted_documents, text_content) if text
+        ])
+        bump_corpus_version()
+
+        # ✅ Show success message, with the work saved by deduplication
+        skipped = []
+        if duplicates:
+            skipped.append(f"{len(duplicates)} duplicate document(s)")
+        if chunk_filter.skipped:
+            skipped.append(f"{chunk_filter.skipped} repeated chunk(s)")
+        message = f"{'File' if file_name else 'Web links'} processed successfully!"
+        if skipped:
+            message += f" Skipped {' and '.join(skipped)}."
+        notify(message, "success")
+        return {"success": True, "message": message}
 
-        for file_path in working_dir.glob("*"):  # This will iterate over all files in the directory
-            if file_path.is_file():  # Ensure we are uploading files, not directories
-                upload_file(file_path)  # Upload the file to your DigitalOcean Space
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": str(e)}
 
-        # ✅ Show success message
-        st.success(f"✅ {'File' if file_name else 'Web links'} processed successfully!")
-        return {"success": True}
+
+def _upload_workspace(working_dir: Path):
+    for file_path in working_dir.glob("*"):  # This will iterate over all files in the directory
+        if file_path.is_file():  # Ensure we are uploading files, not directories
+            upload_file(file_path)  # Upload the file to your DigitalOcean Space
+
+
+def _extract_with_chunks(file_name: str, file_path: Path):
+    """Parse a file into (ExtractedDocument, FAISS chunks), chunked the way it was first ingested."""
+    if STREAMING_INGESTION and file_path.suffix.lower() == ".pdf":
+        document = ExtractedDocument(file_name, str(file_path), [PageContent(*page) for page in iter_pages(str(file_path))])
+    else:
+        document = process_document.extract_document(file_path, file_name)
+    return document, document.chunks()
+
+
+def update_file_doc(file_name: str, file_path: str, on_progress=None):
+    """Re-ingest a revised version of a stored file, touching only the chunks that changed.
+
+    The new text is diffed chunk by chunk against what LightRAG and FAISS hold for the
+    previous version: only new chunks are embedded and sent to entity extraction, and
+    retired chunks are removed from both. Files not stored yet are ingested normally.
+    """
+    from rag_factory import RAGFactory
+    from inference import update_faiss_source
+    from lightrag_updates import update_document as update_lightrag_document
+
+    def report(progress, message):
+        if on_progress:
+            on_progress(progress, message)
+
+    if not check_if_file_exists(file_name):
+        return ingress_file_doc(file_name=file_name, file_path=file_path, on_progress=on_progress)
+
+    try:
+        source_hash = file_hash(file_path)
+        if find_duplicate_document(source_hash=source_hash) == file_name:
+            message = f"'{file_name}' is unchanged; nothing to update."
+            notify(message, "info")
+            return {"success": True, "message": message}
+
+        report(0.05, "Parsing file")
+        try:
+            document, chunks = _extract_with_chunks(file_name, Path(file_path))
+        except ValueError:
+            return {"error": "❌ Unsupported file format."}
+        text = document.full_text()
+        if not text:
+            return {"error": "No valid content extracted from file."}
+        old_text = get_document_text(file_name) or ""
+
+        working_dir = Path("./analysis_workspace")
+        working_dir.mkdir(parents=True, exist_ok=True)
+
+        report(0.2, "Updating knowledge graph")
+        rag = RAGFactory.create_rag(str(working_dir))
+        graph_counts = update_lightrag_document(rag, file_name, old_text, text)
+        RAGFactory.invalidate(str(working_dir))  # Queries must pick up the new graph/vectors
+        logger.debug("LightRAG chunks for '%s': %s", file_name, graph_counts)
+
+        report(0.7, "Updating vector index")
+        counts = update_faiss_source(document.source, chunks, chunk_filter=RepeatedChunkFilter())
+
+        report(0.85, "Saving text")
+        update_document(file_name, text, source_hash, document.source)
+
+        report(0.9, "Uploading workspace")
+        _upload_workspace(working_dir)
+
+        message = (
+            f"'{file_name}' updated: {counts['added']} new and {counts['retired']} retired chunk(s), "
+            f"{counts['kept']} unchanged."
+        )
+        notify(message, "success")
+        return {"success": True, "message": message}
 
     except Exception as e:
         traceback.print_exc()
         return {"error": str(e)}
 
-    finally:
-        conn.close()
+
+def delete_file_doc(file_name: str, on_progress=None):
+    """Remove a stored document from SQLite, FAISS and LightRAG without rebuilding either index.
+
+    FAISS chunks are found through the document's source (indexed in the docstore) and
+    LightRAG chunks through the chunk map recorded at insert time, so the cost is
+    proportional to the document, not the corpus.
+    """
+    from rag_factory import RAGFactory
+    from inference import remove_faiss_source
+    from lightrag_updates import delete_document as delete_lightrag_document
+
+    def report(progress, message):
+        if on_progress:
+            on_progress(progress, message)
+
+    if not check_if_file_exists(file_name):
+        return {"error": f"File '{file_name}' is not stored."}
+
+    try:
+        text = get_document_text(file_name)
+        working_dir = Path("./analysis_workspace")
+        if text and working_dir.exists():
+            report(0.1, "Removing from knowledge graph")
+            rag = RAGFactory.create_rag(str(working_dir))
+            removed = delete_lightrag_document(rag, file_name, text)
+            RAGFactory.invalidate(str(working_dir))  # Queries must stop seeing the deleted chunks
+            logger.info("Removed %d LightRAG chunk(s) of '%s'", removed, file_name)
+
+        report(0.6, "Removing from vector index")
+        source = get_document_source(file_name)
+        # Rows stored before sources were recorded: the name (TXT) or the saved upload (PDF)
+        sources = [source] if source else [file_name, str(Path("documents") / file_name)]
+        chunks = sum(remove_faiss_source(source) for source in sources)
+
+        report(0.8, "Removing text")
+        delete_file(file_name)
+
+        if working_dir.exists():
+            report(0.9, "Uploading workspace")
+            _upload_workspace(working_dir)
+
+        message = f"'{file_name}' deleted with {chunks} indexed chunk(s)."
+        notify(message, "success")
+        return {"success": True, "message": message}
+
+    except Exception as e:
+        traceback.print_exc()
+        return {"error": str(e)}
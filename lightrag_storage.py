@@ -0,0 +1,195 @@
+# LightRAG vector storage that searches truncated (Matryoshka) embeddings and re-scores
+# the best candidates with the full-precision vectors. Registered with LightRAG under
+# the name "RescoringVectorDBStorage"; see RAGFactory.create_rag.
+import base64
+import json
+import logging
+import os
+import sqlite3
+import time
+import numpy as np
+from lightrag.lightrag import STORAGES
+from lightrag.storage import NanoVectorDBStorage
+from nano_vectordb import NanoVectorDB
+
+RESCORE_FACTOR = 4          # candidates fetched from the truncated index per requested result
+COLD_DTYPE = np.float16     # full vectors are only used to re-rank a few candidates
+
+
+def truncate_embeddings(vectors: np.ndarray, dim: int) -> np.ndarray:
+    """Keep the first dim components and re-normalize (text-embedding-3 is Matryoshka-trained)."""
+    vectors = np.asarray(vectors, dtype=np.float32)[:, :dim]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class ColdVectorStore:
+    """Full-precision vectors keyed by LightRAG vector id, in an SQLite file next to the index."""
+
+    def __init__(self, path: str, dtype=COLD_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def put_many(self, ids: list[str], vectors: np.ndarray):
+        vectors = np.asarray(vectors).astype(self.dtype)
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)",
+                    [(id_, vector.tobytes()) for id_, vector in zip(ids, vectors)]
+                )
+        finally:
+            conn.close()
+
+    def get_many(self, ids: list[str]) -> dict:
+        if not ids:
+            return {}
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute(
+                f"SELECT id, vector FROM vectors WHERE id IN ({','.join('?' * len(ids))})", ids
+            ).fetchall()
+        finally:
+            conn.close()
+        return {id_: np.frombuffer(blob, dtype=self.dtype).astype(np.float32) for id_, blob in rows}
+
+    def delete(self, ids: list[str]):
+        conn = sqlite3.connect(self.path)
+        try:
+            with conn:
+                conn.executemany("DELETE FROM vectors WHERE id = ?", [(id_,) for id_ in ids])
+        finally:
+            conn.close()
+
+
+class RescoringVectorDBStorage(NanoVectorDBStorage):
+    """NanoVectorDB over the first search_dim components; top candidates re-scored at full dimension.
+
+    The embedding function returns full vectors. They go to the cold store (float16)
+    and only their truncated, re-normalized prefix is kept in vdb_<namespace>.json, so
+    the file LightRAG loads and syncs shrinks by full_dim / search_dim. Configure with
+    vector_db_storage_cls_kwargs={"search_dim": 512, "rescore_factor": 4}.
+    """
+
+    def __post_init__(self):
+        options = self.global_config.get("vector_db_storage_cls_kwargs", {})
+        self.full_dim = self.embedding_func.embedding_dim
+        self.search_dim = min(options.get("search_dim", self.full_dim), self.full_dim)
+        self.rescore_factor = options.get("rescore_factor", RESCORE_FACTOR)
+
+        working_dir = self.global_config["working_dir"]
+        self._client_file_name = os.path.join(working_dir, f"vdb_{self.namespace}.json")
+        self._cold = ColdVectorStore(os.path.join(working_dir, f"vdb_{self.namespace}_full.db"))
+        self._deleted_ids = []
+        self._resize_existing_index()
+
+        self._max_batch_size = self.global_config["embedding_batch_num"]
+        self._client = NanoVectorDB(self.search_dim, storage_file=self._client_file_name)
+        self.cosine_better_than_threshold = self.global_config.get(
+            "cosine_better_than_threshold", self.cosine_better_than_threshold
+        )
+
+    def _resize_existing_index(self):
+        """Rewrite an index built at another dimension (e.g. the original 3072-d one) in place.
+
+        Full vectors found in the index are moved to the cold store first, so the index
+        can later be widened again without re-embedding.
+        """
+        if not os.path.exists(self._client_file_name):
+            return
+        with open(self._client_file_name, encoding="utf-8") as f:
+            storage = json.load(f)
+        stored_dim = storage["embedding_dim"]
+        if stored_dim == self.search_dim:
+            return
+
+        ids = [d["__id__"] for d in storage["data"]]
+        matrix = np.frombuffer(base64.b64decode(storage["matrix"]), dtype=np.float32).reshape(-1, stored_dim)
+        if stored_dim == self.full_dim:
+            self._cold.put_many(ids, matrix)
+            full = matrix
+        else:
+            cold = self._cold.get_many(ids)
+            missing = [id_ for id_ in ids if id_ not in cold]
+            if missing:
+                raise ValueError(
+                    f"Cannot resize vdb_{self.namespace} from {stored_dim} to {self.search_dim} dims: "
+                    f"{len(missing)} full vectors are missing from the cold store"
+                )
+            full = np.stack([cold[id_] for id_ in ids]) if ids else np.empty((0, self.full_dim), np.float32)
+
+        storage["embedding_dim"] = self.search_dim
+        storage["matrix"] = base64.b64encode(truncate_embeddings(full, self.search_dim).tobytes()).decode()
+        tmp_name = self._client_file_name + ".tmp"
+        with open(tmp_name, "w", encoding="utf-8") as f:
+            json.dump(storage, f, ensure_ascii=False)
+        os.replace(tmp_name, self._client_file_name)
+        logging.info(f"Resized vdb_{self.namespace} from {stored_dim} to {self.search_dim} dims ({len(ids)} vectors)")
+
+    async def upsert(self, data: dict[str, dict]):
+        if not data:
+            logging.warning("You insert an empty data to vector DB")
+            return []
+
+        ids = list(data.keys())
+        contents = [v["content"] for v in data.values()]
+        full = np.concatenate([
+            await self.embedding_func(contents[i:i + self._max_batch_size])
+            for i in range(0, len(contents), self._max_batch_size)
+        ])
+        self._cold.put_many(ids, full)
+
+        truncated = truncate_embeddings(full, self.search_dim)
+        current_time = time.time()
+        list_data = [
+            {
+                "__id__": id_,
+                "__created_at__": current_time,
+                **{k: v for k, v in value.items() if k in self.meta_fields},
+                "__vector__": truncated[i],
+            }
+            for i, (id_, value) in enumerate(data.items())
+        ]
+        return self._client.upsert(datas=list_data)
+
+    async def query(self, query: str, top_k=5):
+        full_query = np.asarray(await self.embedding_func([query]), dtype=np.float32)
+        candidates = self._client.query(
+            query=truncate_embeddings(full_query, self.search_dim)[0],
+            top_k=top_k * self.rescore_factor,
+        )
+        full_vectors = self._cold.get_many([dp["__id__"] for dp in candidates])
+        query_vector = truncate_embeddings(full_query, self.full_dim)[0]
+
+        rescored = []
+        for dp in candidates:
+            vector = full_vectors.get(dp["__id__"])
+            if vector is not None:
+                score = float(np.dot(vector, query_vector) / (np.linalg.norm(vector) or 1))
+            else:
+                score = float(dp["__metrics__"])  # no full vector: keep the truncated score
+            if score >= self.cosine_better_than_threshold:
+                rescored.append({**dp, "id": dp["__id__"], "distance": score, "created_at": dp.get("__created_at__")})
+        rescored.sort(key=lambda dp: dp["distance"], reverse=True)
+        return rescored[:top_k]
+
+    async def delete(self, ids: list[str]):
+        await super().delete(ids)
+        # Dropped from the cold store once the index file without them has been saved
+        self._deleted_ids.extend(ids)
+
+    async def index_done_callback(self):
+        self._client.save()
+        if self._deleted_ids:
+            self._cold.delete(self._deleted_ids)
+            self._deleted_ids = []
+
+
+STORAGES["RescoringVectorDBStorage"] = __name__
@@ -0,0 +1,397 @@
+# Chunk-level changes to documents already in the LightRAG workspace. A revised document
+# is diffed against the chunks LightRAG stored for its previous text: unchanged chunks
+# are re-pointed at the new document id, only new chunks are embedded and sent to entity
+# extraction, and retired chunks are removed together with the entities and relations
+# that only they supported. Deleting a document removes all of its chunks the same way.
+# This mirrors LightRAG's own adelete_by_doc_id, restricted to the chunks that go.
+#
+# Chunk ids are hashes of the chunk text, so two documents can share a chunk. Which
+# chunks each file produced, and which graph nodes and edges each chunk contributed to,
+# is recorded in files.db when the file is inserted (lightrag_chunks, lightrag_refs);
+# updates and deletes read that map instead of scanning the workspace, and never remove
+# a chunk another file still holds. Files inserted before the map existed fall back to
+# scanning.
+import asyncio
+import logging
+from contextlib import contextmanager
+from dataclasses import asdict
+from datetime import datetime
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from lightrag.base import DocStatus
+from lightrag.operate import chunking_by_token_size, extract_entities
+from lightrag.prompt import GRAPH_FIELD_SEP
+from lightrag.utils import compute_mdhash_id, encode_string_by_tiktoken
+from db_helper import connection, transaction
+
+SQL_BATCH = 500   # chunk ids per IN (...) query
+
+
+def paragraph_chunking(
+    content: str,
+    split_by_character=None,
+    split_by_character_only=False,
+    overlap_token_size=128,
+    max_token_size=1024,
+    tiktoken_model="gpt-4o",
+    **kwargs,
+):
+    """LightRAG chunking_func that splits on paragraph and sentence boundaries.
+
+    LightRAG's default cuts fixed token windows, so an edit on one page shifts every
+    later window and the whole tail of the document gets new chunk ids. Splitting on
+    separators re-synchronises right after the edit, which is what makes update_document
+    cheap. Same size limits and output format as lightrag.operate.chunking_by_token_size.
+    """
+    if split_by_character:
+        return chunking_by_token_size(
+            content, split_by_character, split_by_character_only, overlap_token_size, max_token_size, tiktoken_model
+        )
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        model_name=tiktoken_model, chunk_size=max_token_size, chunk_overlap=overlap_token_size
+    )
+    return [
+        {
+            "tokens": len(encode_string_by_tiktoken(chunk, model_name=tiktoken_model)),
+            "content": chunk.strip(),
+            "chunk_order_index": index,
+        }
+        for index, chunk in enumerate(splitter.split_text(content))
+    ]
+
+
+def _chunk(rag, content: str, doc_id: str) -> dict:
+    """Chunks of content keyed by chunk id, exactly as LightRAG.ainsert would store them."""
+    return {
+        compute_mdhash_id(dp["content"], prefix="chunk-"): {**dp, "full_doc_id": doc_id}
+        for dp in rag.chunking_func(
+            content,
+            overlap_token_size=rag.chunk_overlap_token_size,
+            max_token_size=rag.chunk_token_size,
+            tiktoken_model=rag.tiktoken_model_name,
+            **rag.chunking_func_kwargs,
+        )
+    }
+
+
+def _sources(data: dict) -> set:
+    return set(data.get("source_id", "").split(GRAPH_FIELD_SEP)) - {""}
+
+
+def _batches(items: list):
+    for i in range(0, len(items), SQL_BATCH):
+        yield items[i:i + SQL_BATCH]
+
+
+@contextmanager
+def _recording_refs(graph, chunk_ids: set, refs: set):
+    """Add (chunk_id, entity, target) to refs for every node and edge chunk_ids contribute to while active.
+
+    target is "" for a node and the other end for an edge.
+    """
+    upsert_node, upsert_edge = graph.upsert_node, graph.upsert_edge
+
+    async def record_node(node_id, node_data):
+        refs.update((chunk_id, node_id, "") for chunk_id in _sources(node_data) & chunk_ids)
+        await upsert_node(node_id, node_data)
+
+    async def record_edge(source_node_id, target_node_id, edge_data):
+        refs.update((chunk_id, source_node_id, target_node_id) for chunk_id in _sources(edge_data) & chunk_ids)
+        await upsert_edge(source_node_id, target_node_id, edge_data)
+
+    graph.upsert_node, graph.upsert_edge = record_node, record_edge
+    try:
+        yield
+    finally:
+        del graph.upsert_node, graph.upsert_edge  # back to the class methods
+
+
+def _mapped_chunks(file_name: str):
+    """Chunk ids recorded for file_name, or None if it was inserted before the map existed."""
+    with connection() as conn:
+        rows = conn.execute("SELECT chunk_id FROM lightrag_chunks WHERE file_name = ?;", (file_name,)).fetchall()
+    return [row[0] for row in rows] if rows else None
+
+
+def _held_elsewhere(file_name: str, chunk_ids: list[str]) -> set:
+    """The chunk_ids another file also produced."""
+    held = set()
+    with connection() as conn:
+        for batch in _batches(chunk_ids):
+            rows = conn.execute(
+                f"SELECT DISTINCT chunk_id FROM lightrag_chunks WHERE file_name != ? "
+                f"AND chunk_id IN ({','.join('?' * len(batch))});",
+                [file_name, *batch],
+            )
+            held.update(row[0] for row in rows)
+    return held
+
+
+def _refs(chunk_ids: list[str]) -> tuple[set, set]:
+    """Nodes and edges the chunks contributed to."""
+    nodes, edges = set(), set()
+    with connection() as conn:
+        for batch in _batches(chunk_ids):
+            rows = conn.execute(
+                f"SELECT DISTINCT entity, target FROM lightrag_refs WHERE chunk_id IN ({','.join('?' * len(batch))});",
+                batch,
+            )
+            for entity, target in rows:
+                if target:
+                    edges.add((entity, target))
+                else:
+                    nodes.add(entity)
+    return nodes, edges
+
+
+def _save_map(file_name: str, chunk_ids: list[str], refs: set):
+    """Record the chunks of file_name (replacing its previous ones) and the refs of new chunks."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM lightrag_chunks WHERE file_name = ?;", (file_name,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO lightrag_chunks (file_name, chunk_id) VALUES (?, ?);",
+            [(file_name, chunk_id) for chunk_id in chunk_ids],
+        )
+        conn.executemany("INSERT OR IGNORE INTO lightrag_refs (chunk_id, entity, target) VALUES (?, ?, ?);", refs)
+
+
+def _forget_chunks(chunk_ids: list[str]):
+    with transaction() as conn:
+        for batch in _batches(chunk_ids):
+            conn.execute(f"DELETE FROM lightrag_refs WHERE chunk_id IN ({','.join('?' * len(batch))});", batch)
+
+
+def _forget_file(file_name: str):
+    with transaction() as conn:
+        conn.execute("DELETE FROM lightrag_chunks WHERE file_name = ?;", (file_name,))
+
+
+def reset():
+    """Forget the whole chunk map; called when the LightRAG workspace is deleted."""
+    with transaction() as conn:
+        conn.execute("DELETE FROM lightrag_chunks;")
+        conn.execute("DELETE FROM lightrag_refs;")
+
+
+async def _remove_chunks(rag, chunk_ids: list[str], mapped: bool = True):
+    """Delete chunks and drop them from the sources of their entities and relations.
+
+    Entities and relations left without a source are deleted, and every store that
+    changed is saved. With mapped=False (files inserted before the chunk map existed)
+    the whole graph is scanned for the nodes and edges the chunks contributed to.
+    """
+    if not chunk_ids:
+        return
+    retired = set(chunk_ids)
+    await rag.chunks_vdb.delete(chunk_ids)
+    await rag.text_chunks.delete(chunk_ids)  # saves itself
+
+    graph = rag.chunk_entity_relation_graph
+    if mapped:
+        ref_nodes, ref_edges = _refs(chunk_ids)
+        nodes = [(node, await graph.get_node(node)) for node in ref_nodes]
+        edges = [(src, tgt, await graph.get_edge(src, tgt)) for src, tgt in ref_edges]
+        nodes = [(node, data) for node, data in nodes if data is not None]
+        edges = [(src, tgt, data) for src, tgt, data in edges if data is not None]
+    else:
+        nodes = list(graph._graph.nodes(data=True))
+        edges = list(graph._graph.edges(data=True))
+
+    entities_to_delete, relationships_to_delete, graph_changed = set(), set(), False
+    for node, data in nodes:
+        sources = _sources(data)
+        if sources & retired:
+            graph_changed = True
+            sources -= retired
+            if sources:
+                await graph.upsert_node(node, {**data, "source_id": GRAPH_FIELD_SEP.join(sources)})
+            else:
+                entities_to_delete.add(node)
+    for src, tgt, data in edges:
+        sources = _sources(data)
+        if sources & retired:
+            graph_changed = True
+            sources -= retired
+            if sources and src not in entities_to_delete and tgt not in entities_to_delete:
+                await graph.upsert_edge(src, tgt, {**data, "source_id": GRAPH_FIELD_SEP.join(sources)})
+            else:
+                relationships_to_delete.add((src, tgt))
+    for entity in entities_to_delete:
+        # Relations of a deleted entity go with it, whatever their sources
+        relationships_to_delete.update(await graph.get_node_edges(entity) or [])
+
+    for entity in entities_to_delete:
+        await rag.entities_vdb.delete_entity(entity)
+    for src, tgt in relationships_to_delete:
+        await rag.relationships_vdb.delete(
+            [compute_mdhash_id(src + tgt, prefix="rel-"), compute_mdhash_id(tgt + src, prefix="rel-")]
+        )
+    graph.remove_edges(list(relationships_to_delete))
+    graph.remove_nodes(list(entities_to_delete))
+    _forget_chunks(chunk_ids)
+
+    saves = [rag.chunks_vdb.index_done_callback()]
+    if graph_changed:
+        saves.append(graph.index_done_callback())
+    if entities_to_delete:
+        saves.append(rag.entities_vdb.index_done_callback())
+    if relationships_to_delete:
+        saves.append(rag.relationships_vdb.index_done_callback())
+    await asyncio.gather(*saves)
+    logging.info(
+        f"Removed {len(chunk_ids)} LightRAG chunk(s), {len(entities_to_delete)} entities "
+        f"and {len(relationships_to_delete)} relations"
+    )
+
+
+async def ainsert_documents(rag, documents: list[tuple[str, str]]):
+    """rag.ainsert for (file_name, text) pairs, recording the chunk map of every file it processes."""
+    documents = [(file_name, text.strip()) for file_name, text in documents if text.strip()]
+    chunks, already_processed = {}, set()
+    for file_name, text in documents:
+        doc_id = compute_mdhash_id(text, prefix="doc-")
+        chunks[file_name] = (doc_id, _chunk(rag, text, doc_id))
+        status = await rag.doc_status.get_by_id(doc_id)
+        if status is not None and status["status"] == DocStatus.PROCESSED:
+            already_processed.add(file_name)
+
+    refs = set()
+    chunk_ids = {chunk_id for _, file_chunks in chunks.values() for chunk_id in file_chunks}
+    with _recording_refs(rag.chunk_entity_relation_graph, chunk_ids, refs):
+        await rag.ainsert([text for _, text in documents])
+
+    for file_name, (doc_id, file_chunks) in chunks.items():
+        if file_name in already_processed:
+            continue  # skipped by ainsert, so nothing was recorded for it
+        status = await rag.doc_status.get_by_id(doc_id)
+        if status is None or status["status"] != DocStatus.PROCESSED:
+            logging.warning(f"LightRAG did not process '{file_name}'; its chunk map is not recorded")
+            continue
+        _save_map(file_name, list(file_chunks), {ref for ref in refs if ref[0] in file_chunks})
+
+
+async def aupdate_document(rag, file_name: str, old_content: str, new_content: str) -> dict:
+    """Replace old_content with new_content in rag, re-processing only the chunks that changed.
+
+    Returns {"added": n, "retired": n, "kept": n} chunk counts. If old_content is not in
+    the workspace the new text is simply inserted.
+    """
+    old_content, new_content = old_content.strip(), new_content.strip()
+    old_doc_id = compute_mdhash_id(old_content, prefix="doc-")
+    new_doc_id = compute_mdhash_id(new_content, prefix="doc-")
+    if old_doc_id == new_doc_id:
+        return {"added": 0, "retired": 0, "kept": 0}
+
+    mapped = _mapped_chunks(file_name)
+    if mapped is None:
+        old_ids = list(await rag.text_chunks.filter(lambda chunk: chunk.get("full_doc_id") == old_doc_id))
+    else:
+        old_ids = mapped
+    new_chunks = _chunk(rag, new_content, new_doc_id)
+    old_set = set(old_ids)
+    added = {chunk_id: chunk for chunk_id, chunk in new_chunks.items() if chunk_id not in old_set}
+    kept = [chunk_id for chunk_id in new_chunks if chunk_id in old_set]
+    retired = [chunk_id for chunk_id in old_ids if chunk_id not in new_chunks]
+    held = _held_elsewhere(file_name, retired)
+    retired = [chunk_id for chunk_id in retired if chunk_id not in held]
+
+    # New chunks first: if extraction fails the old version is still complete. Chunks
+    # another document already stored keep their entities and are not extracted again.
+    extract = {chunk_id: added[chunk_id] for chunk_id in await rag.text_chunks.filter_keys(list(added))}
+    refs = set()
+    if extract:
+        await rag.chunks_vdb.upsert(extract)
+        with _recording_refs(rag.chunk_entity_relation_graph, set(extract), refs):
+            maybe_new_kg = await extract_entities(
+                extract,
+                knowledge_graph_inst=rag.chunk_entity_relation_graph,
+                entity_vdb=rag.entities_vdb,
+                relationships_vdb=rag.relationships_vdb,
+                llm_response_cache=rag.llm_response_cache,
+                global_config=asdict(rag),
+            )
+        if maybe_new_kg is not None:
+            rag.chunk_entity_relation_graph = maybe_new_kg
+        else:
+            logging.warning("No new entities or relations found in the changed chunks")
+
+    # Entities also found in a new chunk keep it as a source when the retired one goes
+    await _remove_chunks(rag, retired, mapped=mapped is not None)
+
+    # Kept chunks move to the new document unless another stored document holds them
+    # (a deleted document's shared chunks are taken over too; upsert only inserts missing keys)
+    stored = await rag.text_chunks.get_by_ids(kept)
+    owners = {chunk["full_doc_id"] for chunk in stored if chunk}
+    orphaned = await rag.full_docs.filter_keys(list(owners - {old_doc_id}))
+    moved = {
+        chunk_id: new_chunks[chunk_id]
+        for chunk_id, chunk in zip(kept, stored) if chunk and chunk["full_doc_id"] in orphaned | {old_doc_id}
+    }
+    if moved:
+        await rag.text_chunks.delete(list(moved))
+    await rag.text_chunks.upsert({**moved, **extract})
+
+    await rag.full_docs.delete([old_doc_id])
+    await rag.doc_status.delete([old_doc_id])
+    await rag.full_docs.upsert({new_doc_id: {"content": new_content}})
+    now = datetime.now().isoformat()
+    await rag.doc_status.upsert({new_doc_id: {
+        "content_summary": rag._get_content_summary(new_content),
+        "content_length": len(new_content),
+        "chunks_count": len(new_chunks),
+        "status": DocStatus.PROCESSED,
+        "created_at": now,
+        "updated_at": now,
+    }})
+
+    saves = [rag.full_docs.index_done_callback(), rag.text_chunks.index_done_callback()]
+    if extract:
+        saves += [
+            rag.chunks_vdb.index_done_callback(),
+            rag.entities_vdb.index_done_callback(),
+            rag.relationships_vdb.index_done_callback(),
+            rag.llm_response_cache.index_done_callback(),
+            rag.chunk_entity_relation_graph.index_done_callback(),
+        ]
+    await asyncio.gather(*saves)
+    if mapped is not None:
+        # Unmapped files stay on the scanning path: their kept chunks have no recorded refs
+        _save_map(file_name, list(new_chunks), refs)
+    return {"added": len(added), "retired": len(retired), "kept": len(kept)}
+
+
+async def adelete_document(rag, file_name: str, content: str) -> int:
+    """Remove the document with this text from rag; returns the number of chunks removed.
+
+    Chunks another file also produced stay in the workspace.
+    """
+    doc_id = compute_mdhash_id(content.strip(), prefix="doc-")
+    mapped = _mapped_chunks(file_name)
+    if mapped is None:
+        mapped_ids = list(await rag.text_chunks.filter(lambda chunk: chunk.get("full_doc_id") == doc_id))
+    else:
+        mapped_ids = mapped
+    held = _held_elsewhere(file_name, mapped_ids)
+    retired = [chunk_id for chunk_id in mapped_ids if chunk_id not in held]
+    await _remove_chunks(rag, retired, mapped=mapped is not None)
+    await rag.full_docs.delete([doc_id])  # saves itself, as does doc_status
+    await rag.doc_status.delete([doc_id])
+    _forget_file(file_name)
+    return len(retired)
+
+
+def insert_documents(rag, documents: list[tuple[str, str]]):
+    """Synchronous wrapper around ainsert_documents, on the shared LightRAG loop."""
+    from rag_factory import RAGFactory  # rag_factory imports this module
+    return RAGFactory.run(ainsert_documents(rag, documents))
+
+
+def update_document(rag, file_name: str, old_content: str, new_content: str) -> dict:
+    """Synchronous wrapper around aupdate_document, on the shared LightRAG loop."""
+    from rag_factory import RAGFactory
+    return RAGFactory.run(aupdate_document(rag, file_name, old_content, new_content))
+
+
+def delete_document(rag, file_name: str, content: str) -> int:
+    """Synchronous wrapper around adelete_document, on the shared LightRAG loop."""
+    from rag_factory import RAGFactory
+    return RAGFactory.run(adelete_document(rag, file_name, content))
@@ -0,0 +1,40 @@
+# Non-blocking status messages. notify() queues a message in the session and returns
+# immediately; render_notifications() shows the queued messages as toasts at the end of
+# the run (or the next run, for messages raised in on_change callbacks). Errors also stay
+# in the sidebar until they expire. Nothing here sleeps on the script thread.
+import logging
+import time
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+NOTIFICATION_TTL = 15           # seconds a message stays queued/visible
+ERROR_TTL = 60                  # errors stay in the sidebar longer
+
+ICONS = {"info": "ℹ️", "success": "✅", "warning": "⚠️", "error": "❌"}
+LOG_LEVELS = {"info": logging.INFO, "success": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+def notify(message: str, level: str = "info", ttl: float = None):
+    """Queue message for the current session; outside a session (e.g. the ingestion worker) it is logged."""
+    if get_script_run_ctx() is None:
+        logging.log(LOG_LEVELS[level], message)
+        print(f"{ICONS[level]} {message}")
+        return
+    if ttl is None:
+        ttl = ERROR_TTL if level == "error" else NOTIFICATION_TTL
+    st.session_state.setdefault("notifications", []).append({
+        "message": message, "level": level, "expires_at": time.time() + ttl, "shown": False,
+    })
+
+
+def render_notifications():
+    """Toast new messages, keep unexpired errors in the sidebar and drop expired ones."""
+    now = time.time()
+    notifications = [n for n in st.session_state.get("notifications", []) if n["expires_at"] > now]
+    for notification in notifications:
+        if not notification["shown"]:
+            st.toast(notification["message"], icon=ICONS[notification["level"]])
+            notification["shown"] = True
+        if notification["level"] == "error":
+            st.sidebar.error(f"{ICONS['error']} {notification['message']}")
+    st.session_state["notifications"] = notifications
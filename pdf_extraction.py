@@ -0,0 +1,206 @@
+# Page-level PDF extraction, optionally spread over a process pool.
+# Kept free of Streamlit/LangChain imports so spawned worker processes start quickly.
+import importlib.util
+import logging
+from collections import deque
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pdfplumber
+
+PDF_WORKERS = max(1, (os.cpu_count() or 1) - 1)
+MIN_PAGES_PER_WORKER = 8   # below this, process start-up costs more than it saves
+MAX_RANGE_PAGES = 32       # pages per pool task; with two tasks per worker in flight, bounds pages parsed ahead
+
+# Text backend: "pymupdf" or "pypdfium2" extract plain text in C and hand only pages
+# that look like they contain ruled tables to pdfplumber; "pdfplumber" parses every page.
+PDF_BACKEND = os.environ.get("PDF_BACKEND", "pymupdf")
+MIN_TABLE_RULINGS = 2      # horizontal and vertical rulings each needed to suspect a table
+RULING_THICKNESS = 3       # points; thinner rects count as lines
+
+
+def format_table(table) -> str:
+    """Render a pdfplumber table as pipe-separated rows."""
+    return "".join(" | ".join(cell if cell is not None else "" for cell in row) + "\n" for row in table)
+
+
+def _classify_ruling(width: float, height: float):
+    """Return (horizontal, vertical) ruling counts contributed by a box of this size."""
+    if height < RULING_THICKNESS and width >= RULING_THICKNESS:
+        return 1, 0
+    if width < RULING_THICKNESS and height >= RULING_THICKNESS:
+        return 0, 1
+    if width >= RULING_THICKNESS and height >= RULING_THICKNESS:
+        return 2, 2  # a cell border
+    return 0, 0
+
+
+def _has_table_rulings(horizontal: int, vertical: int) -> bool:
+    # pdfplumber's lines strategy needs intersecting rulings, so both directions must be present
+    return horizontal >= MIN_TABLE_RULINGS and vertical >= MIN_TABLE_RULINGS
+
+
+def _pymupdf_pages(path: str, start: int, end: int):
+    import fitz
+
+    with fitz.open(path) as doc:
+        for index in range(start, end):
+            page = doc[index]
+            horizontal = vertical = 0
+            for drawing in page.get_drawings():
+                for item in drawing["items"]:
+                    if item[0] == "l":
+                        p1, p2 = item[1], item[2]
+                        h, v = _classify_ruling(abs(p1.x - p2.x), abs(p1.y - p2.y))
+                    elif item[0] == "re":
+                        h, v = _classify_ruling(item[1].width, item[1].height)
+                    else:
+                        continue
+                    horizontal += h
+                    vertical += v
+            yield index, page.get_text("text"), _has_table_rulings(horizontal, vertical)
+
+
+def _pypdfium2_pages(path: str, start: int, end: int):
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for index in range(start, end):
+            page = pdf[index]
+            horizontal = vertical = 0
+            for obj in page.get_objects(filter=(pdfium.raw.FPDF_PAGEOBJ_PATH,)):
+                left, bottom, right, top = obj.get_pos()
+                h, v = _classify_ruling(right - left, top - bottom)
+                horizontal += h
+                vertical += v
+            textpage = page.get_textpage()
+            text = textpage.get_text_bounded()
+            textpage.close()
+            page.close()
+            yield index, text, _has_table_rulings(horizontal, vertical)
+    finally:
+        pdf.close()
+
+
+FAST_BACKENDS = {"pymupdf": _pymupdf_pages, "pypdfium2": _pypdfium2_pages}
+_BACKEND_MODULES = {"pymupdf": "fitz", "pypdfium2": "pypdfium2"}
+
+
+def resolve_backend(backend: str) -> str:
+    """Return backend if its library is importable, otherwise fall back to pdfplumber."""
+    if backend in FAST_BACKENDS and importlib.util.find_spec(_BACKEND_MODULES[backend]) is None:
+        logging.warning(f"PDF backend '{backend}' is not installed; falling back to pdfplumber")
+        return "pdfplumber"
+    return backend if backend in FAST_BACKENDS else "pdfplumber"
+
+
+def _pdfplumber_page_range(path: str, start: int, end: int):
+    with pdfplumber.open(path) as pdf:
+        for index in range(start, end):
+            page_start = time.perf_counter()
+            page = pdf.pages[index]
+            text = page.extract_text() or ""
+            tables = [format_table(table) for table in page.extract_tables()]
+            page.close()  # release pdfminer layout objects as we go
+            yield index + 1, text, tables, time.perf_counter() - page_start
+
+
+def iter_page_range(path: str, start: int, end: int, backend: str = PDF_BACKEND):
+    """Yield (page_number, text, tables, seconds) for pages [start, end), one page at a time."""
+    page_func = FAST_BACKENDS.get(resolve_backend(backend))
+    if page_func is None or not isinstance(path, str):
+        yield from _pdfplumber_page_range(path, start, end)
+        return
+
+    plumber = None
+    try:
+        page_start = time.perf_counter()
+        for index, text, needs_tables in page_func(path, start, end):
+            tables = []
+            if needs_tables:
+                # Only pages with ruled layouts pay for pdfplumber's table finder
+                if plumber is None:
+                    plumber = pdfplumber.open(path)
+                page = plumber.pages[index]
+                tables = [format_table(table) for table in page.extract_tables()]
+                page.close()
+            now = time.perf_counter()
+            yield index + 1, text, tables, now - page_start
+            page_start = now
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+
+def extract_page_range(path: str, start: int, end: int, backend: str = PDF_BACKEND) -> list[tuple]:
+    """Extract pages [start, end) and return (page_number, text, tables, seconds) per page."""
+    return list(iter_page_range(path, start, end, backend))
+
+
+def iter_pages(path: str, workers: int = PDF_WORKERS, backend: str = PDF_BACKEND):
+    """Yield every page of a PDF in order without holding the whole document in memory.
+
+    Large PDFs are split into contiguous page ranges extracted by a process pool. At
+    most two ranges per worker are in flight, and their pages are yielded in order as
+    each range completes, so the pool only ever runs a bounded distance ahead of the consumer.
+    """
+    backend = resolve_backend(backend)
+    total_pages = count_pages(path, backend)
+    workers = min(workers, total_pages // MIN_PAGES_PER_WORKER) if isinstance(path, str) else 1
+    if workers <= 1:
+        yield from iter_page_range(path, 0, total_pages, backend)
+        return
+
+    # A few more ranges than workers evens out pages that are much slower than their neighbours
+    range_pages = max(MIN_PAGES_PER_WORKER, min(MAX_RANGE_PAGES, -(-total_pages // (workers * 2))))
+    ranges = deque((start, min(start + range_pages, total_pages)) for start in range(0, total_pages, range_pages))
+    # spawn: the Streamlit server is multi-threaded, which makes fork unsafe
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        in_flight = deque()
+        while ranges or in_flight:
+            while ranges and len(in_flight) < workers * 2:
+                in_flight.append(executor.submit(extract_page_range, path, *ranges.popleft(), backend))
+            yield from in_flight.popleft().result()
+    finally:
+        # Also reached when the consumer stops early: drop the ranges nobody will read
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def count_pages(path: str, backend: str = PDF_BACKEND) -> int:
+    backend = resolve_backend(backend)
+    if backend == "pymupdf" and isinstance(path, str):
+        import fitz
+
+        with fitz.open(path) as doc:
+            return doc.page_count
+    if backend == "pypdfium2" and isinstance(path, str):
+        import pypdfium2 as pdfium
+
+        pdf = pdfium.PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pages(path: str, workers: int = PDF_WORKERS, backend: str = PDF_BACKEND) -> list[tuple]:
+    """Extract every page of a PDF, in page order, splitting page ranges across processes.
+
+    Returns (page_number, text, tables, seconds) tuples and logs the slowest pages.
+    """
+    start = time.perf_counter()
+    backend = resolve_backend(backend)
+    results = list(iter_pages(path, workers, backend))
+
+    elapsed = time.perf_counter() - start
+    slowest = sorted(results, key=lambda page: page[3], reverse=True)[:3]
+    logging.info(
+        f"Extracted {len(results)} pages from {path} with {backend} in {elapsed:.2f}s; "
+        f"slowest pages: " + ", ".join(f"p{page[0]}={page[3]:.2f}s" for page in slowest)
+    )
+    return results
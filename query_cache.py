@@ -0,0 +1,139 @@
+import logging
+import re
+import time
+from db_helper import connection, transaction
+
+# Query expansion cache settings
+EXPANSION_TTL = 7 * 24 * 3600       # seconds before a cached expansion is recomputed
+MAX_EXPANSIONS = 5000               # LRU bound on cached expansions
+
+# Answer cache settings
+MAX_ANSWER_CACHE_BYTES = 64 * 1024 * 1024   # total size of cached responses + sources
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so trivially different phrasings share a key."""
+    query = re.sub(r"\s+", " ", query.strip().lower())
+    return query.rstrip("?!. ")
+
+
+def _record_stat(cursor, cache_name: str, hit: bool):
+    column = "hits" if hit else "misses"
+    cursor.execute("INSERT OR IGNORE INTO cache_stats (cache_name) VALUES (?);", (cache_name,))
+    cursor.execute(f"UPDATE cache_stats SET {column} = {column} + 1 WHERE cache_name = ?;", (cache_name,))
+
+
+def get_cache_stats() -> dict:
+    """Return {cache_name: {"hits": n, "misses": n}} for every query cache."""
+    with connection() as conn:
+        rows = conn.execute("SELECT cache_name, hits, misses FROM cache_stats;").fetchall()
+    return {name: {"hits": hits, "misses": misses} for name, hits, misses in rows}
+
+
+def _evict_expansions(cursor, now: float):
+    cursor.execute("DELETE FROM query_expansions WHERE created_at < ?;", (now - EXPANSION_TTL,))
+    cursor.execute("""
+        DELETE FROM query_expansions WHERE normalized_query IN (
+            SELECT normalized_query FROM query_expansions ORDER BY last_used DESC LIMIT -1 OFFSET ?
+        );
+    """, (MAX_EXPANSIONS,))
+
+
+def get_or_create_expansion(query: str, expand_fn) -> str:
+    """Return the cached expansion for query, calling expand_fn(query) only on a miss.
+
+    Lookup is an exact match on the normalized query. There is deliberately no
+    embedding-similarity fallback: ada-002 scores unrelated clinical questions (the
+    dosage of drug A vs drug B) above 0.97, so a near neighbour may be a different
+    question, and every miss would pay for an extra embedding call.
+    """
+    key = normalize_query(query)
+    now = time.time()
+    with connection() as conn:
+        cursor = conn.cursor()
+        row = cursor.execute(
+            "SELECT expansion FROM query_expansions WHERE normalized_query = ? AND created_at >= ?;",
+            (key, now - EXPANSION_TTL),
+        ).fetchone()
+
+        with transaction():
+            if row:
+                cursor.execute(
+                    "UPDATE query_expansions SET last_used = ?, hits = hits + 1 WHERE normalized_query = ?;",
+                    (now, key),
+                )
+            _record_stat(cursor, "query_expansion", hit=row is not None)
+        if row:
+            return row[0]
+
+    # Run the LLM call without holding the database open
+    expansion = expand_fn(query)
+
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR REPLACE INTO query_expansions (normalized_query, expansion, created_at, last_used)
+                VALUES (?, ?, ?, ?);
+            """, (key, expansion, now, now))
+            _evict_expansions(cursor, now)
+    except Exception as e:
+        logging.error(f"Failed to cache query expansion: {e}")
+    return expansion
+
+
+def get_cached_answer(query: str, corpus_version: int):
+    """Return (response, sources) cached for query at corpus_version, or None."""
+    key = normalize_query(query)
+    with connection() as conn:
+        cursor = conn.cursor()
+        row = cursor.execute(
+            "SELECT response, sources FROM answer_cache WHERE normalized_query = ? AND corpus_version = ?;",
+            (key, corpus_version),
+        ).fetchone()
+        with transaction():
+            if row:
+                cursor.execute(
+                    "UPDATE answer_cache SET last_used = ? WHERE normalized_query = ? AND corpus_version = ?;",
+                    (time.time(), key, corpus_version),
+                )
+            _record_stat(cursor, "answer", hit=row is not None)
+    return row
+
+
+def _evict_answers(cursor):
+    total = cursor.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM answer_cache;").fetchone()[0]
+    if total <= MAX_ANSWER_CACHE_BYTES:
+        return
+    # Drop least recently used entries until the cache fits its byte budget again
+    for key, version, size in cursor.execute(
+        "SELECT normalized_query, corpus_version, size_bytes FROM answer_cache ORDER BY last_used;"
+    ).fetchall():
+        if total <= MAX_ANSWER_CACHE_BYTES:
+            break
+        cursor.execute(
+            "DELETE FROM answer_cache WHERE normalized_query = ? AND corpus_version = ?;", (key, version)
+        )
+        total -= size
+
+
+def store_answer(query: str, corpus_version: int, response: str, sources: str):
+    """Cache a complete answer under the corpus version that was current when it was computed."""
+    key = normalize_query(query)
+    now = time.time()
+    size = len(response.encode("utf-8")) + len(sources.encode("utf-8"))
+    try:
+        with transaction() as conn:
+            cursor = conn.cursor()
+            # A version bump may have happened while the answer was being computed; never store it then
+            current = cursor.execute("SELECT version FROM corpus_version WHERE id = 1;").fetchone()
+            if current and current[0] != corpus_version:
+                return
+            cursor.execute("""
+                INSERT OR REPLACE INTO answer_cache
+                    (normalized_query, corpus_version, response, sources, size_bytes, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?);
+            """, (key, corpus_version, response, sources, size, now, now))
+            _evict_answers(cursor)
+    except Exception as e:
+        logging.error(f"Failed to cache answer: {e}")
@@ -0,0 +1,119 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+from pathlib import Path
+import numpy as np
+
+import streamlit as st
+from lightrag import LightRAG
+from lightrag.llm.openai import gpt_4o_complete
+from lightrag.utils import EmbeddingFunc
+from do_spaces import download_all_files
+from embedding_cache import embedding_cache
+from embedding_client import aembed_texts
+from lightrag_updates import paragraph_chunking
+
+# Dimensions of text-embedding-3-large kept in LightRAG's searchable vector files
+# (256, 512, 1024 or 3072). Below 3072 the full vectors move to a float16 cold store
+# and are used to re-score the top candidates; see lightrag_storage.py.
+LIGHTRAG_SEARCH_DIM = int(os.environ.get("LIGHTRAG_SEARCH_DIM", 3072))
+
+
+async def openai_embedding_func(texts: list[str]) -> np.ndarray:
+    # Token-packed batches sent concurrently, with rate-limit aware retries
+    return await aembed_texts(
+        texts,
+        model="text-embedding-3-large",
+        api_key=st.secrets["OPENAI_API_KEY"],
+    )
+
+
+async def embedding_func(texts: list[str]) -> np.ndarray:
+    """LightRAG embedding function; identical chunks are served from the embedding cache."""
+    return await embedding_cache.aembed(texts, "text-embedding-3-large", 3072, openai_embedding_func)
+
+
+class RAGFactory:
+    _shared_embedding = EmbeddingFunc(
+        embedding_dim=3072,
+        max_token_size=8192,
+        func=embedding_func
+    )
+
+    # Process-wide registry of warm LightRAG engines, keyed by resolved working dir.
+    # Lives in an imported module (not the Streamlit script) so it survives reruns
+    # and is shared by every session served by this process.
+    _engines: dict[str, LightRAG] = {}
+    _lock = threading.Lock()
+
+    # Every LightRAG call in the process runs on this one event loop and thread. The
+    # stores' asyncio locks bind to the loop that first uses them, and their dicts and
+    # the NetworkX graph are not safe to mutate from several threads at once.
+    _loop: asyncio.AbstractEventLoop = None
+    _loop_lock = threading.Lock()
+
+    @classmethod
+    def submit(cls, coro) -> concurrent.futures.Future:
+        """Schedule a LightRAG coroutine on the shared loop; cancelling the future cancels it."""
+        with cls._loop_lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="lightrag-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, cls._loop)
+
+    @classmethod
+    def run(cls, coro, timeout: float = None):
+        """Run a LightRAG coroutine on the shared loop from any thread and return its result."""
+        return cls.submit(coro).result(timeout)
+
+    @classmethod
+    def create_rag(cls, working_dir: str) -> LightRAG:
+        """Create a LightRAG instance with shared configuration"""
+        storage_options = {}
+        if LIGHTRAG_SEARCH_DIM < cls._shared_embedding.embedding_dim:
+            import lightrag_storage  # registers RescoringVectorDBStorage with LightRAG
+
+            storage_options = {
+                "vector_storage": "RescoringVectorDBStorage",
+                "vector_db_storage_cls_kwargs": {"search_dim": LIGHTRAG_SEARCH_DIM},
+            }
+        return LightRAG(
+            working_dir=working_dir,
+            addon_params={"insert_batch_size": 50},
+            chunking_func=paragraph_chunking,  # edits only change nearby chunks; see lightrag_updates.py
+            llm_model_func=gpt_4o_complete,
+            embedding_func=cls._shared_embedding,
+            **storage_options
+        )
+
+    @classmethod
+    def get_rag(cls, working_dir: str) -> LightRAG:
+        """Return the warm LightRAG engine for working_dir, building it on first use.
+
+        The workspace is synced from the Space and the stores are loaded from disk
+        only once per process; call invalidate() after anything rewrites the workspace.
+        """
+        key = str(Path(working_dir).resolve())
+        rag = cls._engines.get(key)
+        if rag is not None:
+            return rag
+
+        with cls._lock:
+            rag = cls._engines.get(key)
+            if rag is None:
+                download_all_files(Path(working_dir))
+                rag = cls.create_rag(working_dir)
+                cls._engines[key] = rag
+                logging.info(f"Built LightRAG engine for {key}")
+        return rag
+
+    @classmethod
+    def invalidate(cls, working_dir: str = None):
+        """Drop the cached engine for working_dir (or all engines) so the next query reloads it."""
+        with cls._lock:
+            if working_dir is None:
+                cls._engines.clear()
+            else:
+                cls._engines.pop(str(Path(working_dir).resolve()), None)
@@ -0,0 +1,190 @@
+import logging
+import queue
+import tempfile
+import threading
+import time
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from db_helper import BlobWriter
+from utils import clean_text
+
+STAGE_QUEUE_SIZE = 4        # items buffered between stages; bounds peak memory
+EMBED_BATCH_SIZE = 64       # chunks per embedding call
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+TABLE_READ_CHARS = 1 << 20  # spooled table text copied into the blob this much at a time
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, error):
+        self.error = error
+
+
+def buffered(iterable, maxsize: int = STAGE_QUEUE_SIZE, name: str = "stage"):
+    """Run iterable in a background thread, handing items over through a bounded queue.
+
+    The producer blocks once maxsize items are waiting, so a slow consumer applies
+    back-pressure instead of letting the stage run ahead and buffer the whole document.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_StageError(e))
+        finally:
+            put(_DONE)
+
+    thread = threading.Thread(target=produce, name=f"ingest-{name}", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+    finally:
+        # Consumer finished or failed: let the producer exit instead of blocking on a full queue
+        stop.set()
+        while not items.empty():
+            items.get_nowait()
+
+
+def clean_pages(pages):
+    """pages: (page_number, text, tables, seconds) tuples -> (page_number, cleaned text)."""
+    for page_number, text, _tables, _seconds in pages:
+        if text:
+            yield page_number, clean_text(text)
+
+
+def chunk_pages(pages, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+    """Split a stream of (page_number, text) into (chunk_text, page_number) as pages arrive.
+
+    The last chunk of each page is held back and re-split together with the next page,
+    so text running across a page break still ends up in one chunk. Boundaries near a
+    break are not those of one split over the whole text, though: the split that ends a
+    page can leave a shorter chunk behind. ExtractedDocument.chunks() uses this function
+    too, so a file is chunked the same whichever ingestion path reads it.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+    tail, tail_page = "", None
+    for page_number, text in pages:
+        buffer = tail + text + "\n"
+        chunks = splitter.create_documents([buffer])
+        for chunk in chunks[:-1]:
+            start = chunk.metadata["start_index"]
+            yield chunk.page_content, tail_page if tail_page is not None and start < len(tail) else page_number
+        if chunks:
+            last = chunks[-1]
+            start = last.metadata["start_index"]
+            tail_page = tail_page if tail_page is not None and start < len(tail) else page_number
+            tail = buffer[start:]
+    if tail.strip():
+        for chunk in splitter.split_text(tail):
+            yield chunk, tail_page
+
+
+def batched(items, size: int = EMBED_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def embed_batches(batches, embed_fn, keep_fn=None):
+    """(chunk_text, page_number) batches -> (texts, vectors, pages) batches.
+
+    keep_fn(texts) returns the indices of the chunks worth embedding (see dedup.py).
+    """
+    for batch in batches:
+        if keep_fn is not None:
+            batch = [batch[i] for i in keep_fn([text for text, _ in batch])]
+            if not batch:
+                continue
+        texts = [text for text, _ in batch]
+        yield texts, embed_fn(texts), [page for _, page in batch]
+
+
+def stream_pages_into_index(pages, source: str, embed_fn, index_fn, on_page=None, chunk_filter=None) -> int:
+    """Stream pages through clean -> chunk -> embed -> index with bounded queues between stages.
+
+    pages yields (page_number, text, tables, seconds); embed_fn(list[str]) returns vectors;
+    index_fn(texts, vectors, metadatas) adds one batch to the vector store. on_page is
+    called with every raw page as it is parsed, e.g. to feed a FullTextWriter.
+    chunk_filter (a dedup.RepeatedChunkFilter) drops chunks repeated within the source before embedding.
+    Returns the number of chunks indexed.
+    """
+    start = time.perf_counter()
+
+    def observed(pages):
+        for page in pages:
+            if on_page is not None:
+                on_page(page)
+            yield page
+
+    parsed = buffered(observed(pages), name="parse")
+    cleaned = buffered(clean_pages(parsed), name="clean")
+    chunk_batches = buffered(batched(chunk_pages(cleaned)), name="chunk")
+    keep_fn = (lambda texts: chunk_filter.keep(texts, [source] * len(texts))) if chunk_filter else None
+    embedded = buffered(embed_batches(chunk_batches, embed_fn, keep_fn), maxsize=2, name="embed")
+
+    total = 0
+    for texts, vectors, page_numbers in embedded:
+        index_fn(texts, vectors, [{"source": source, "page": page} for page in page_numbers])
+        total += len(texts)
+
+    logging.info(f"Streamed {total} chunks from {source} into the index in {time.perf_counter() - start:.2f}s")
+    return total
+
+
+class FullTextWriter:
+    """Builds ExtractedDocument.full_text() from pages as they are parsed, without keeping the pages.
+
+    Page text goes straight into a compressed BlobWriter; tables, which full_text() puts
+    after all page text, wait in a temporary file until close().
+    """
+
+    def __init__(self):
+        self.blob = BlobWriter()
+        self._tables = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._table_count = 0
+        self.pages = 0
+
+    def add(self, page):
+        """page: a (page_number, text, tables, seconds) tuple as yielded by pdf_extraction.iter_pages."""
+        page_number, text, tables, _seconds = page
+        self.pages += 1
+        if text:
+            self.blob.write(f"\n\n[Page {page_number}]\n{text}")
+        for table_idx, table in enumerate(tables or []):
+            separator = "\n\n" if self._table_count else ""
+            self._tables.write(f"{separator}\n\n[Page {page_number} - Table {table_idx + 1}]\n{table}")
+            self._table_count += 1
+
+    def close(self) -> BlobWriter:
+        self._tables.seek(0)
+        for block in iter(lambda: self._tables.read(TABLE_READ_CHARS), ""):
+            self.blob.write(block)
+        self._tables.close()
+        self.blob.close()
+        return self.blob
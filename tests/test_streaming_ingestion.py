@@ -0,0 +1,46 @@
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from document_processor import ExtractedDocument, PageContent
+from streaming_ingestion import CHUNK_OVERLAP, CHUNK_SIZE, chunk_pages
+
+# Page 1 ends with a 550-character paragraph that only fits in a chunk together with
+# the start of page 2; each paragraph is a single run of one letter.
+PAGES = [
+    (1, "\n\n".join(["a" * 400, "b" * 150, "c" * 550])),
+    (2, "\n\n".join(["d" * 300, "e" * 200, "f" * 400])),
+]
+
+
+def _summary(chunks):
+    return [(len(text), text[0], text[-1]) for text in chunks]
+
+
+def _whole_text_split(pages):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return splitter.split_text("".join(text + "\n" for _, text in pages))
+
+
+def test_single_page_matches_whole_text_split():
+    pages = PAGES[:1]
+    assert [text for text, _ in chunk_pages(pages)] == _whole_text_split(pages)
+
+
+def test_text_across_a_page_break_stays_in_one_chunk():
+    chunks = list(chunk_pages(PAGES))
+    spanning = [(text, page) for text, page in chunks if "c\nd" in text]
+    assert len(spanning) == 1
+    assert spanning[0][1] == 1  # tagged with the page the chunk starts on
+
+
+def test_page_break_can_leave_a_shorter_chunk_than_a_whole_text_split():
+    streamed = [text for text, _ in chunk_pages(PAGES)]
+    assert _summary(_whole_text_split(PAGES)) == [(552, "a", "b"), (851, "c", "d"), (602, "e", "f")]
+    assert _summary(streamed) == [(552, "a", "b"), (150, "b", "b"), (851, "c", "d"), (602, "e", "f")]
+    assert [page for _, page in chunk_pages(PAGES)] == [1, 1, 1, 2]
+
+
+def test_extracted_document_chunks_like_the_streaming_pipeline():
+    document = ExtractedDocument("doc.pdf", "documents/doc.pdf", [PageContent(number, text) for number, text in PAGES])
+    chunks = document.chunks()
+    assert [(chunk.page_content, chunk.metadata["page"]) for chunk in chunks] == list(chunk_pages(PAGES))
+    assert {chunk.metadata["source"] for chunk in chunks} == {"documents/doc.pdf"}